@@ -0,0 +1,216 @@
+import numpy as np
+
+from engine import TARIFF_SCHEDULES, VAT, TariffSchedule, fixed_charges, fixed_subtotal_for_payment
+
+def _round2(values) -> np.ndarray:
+    """Round to 2 dp exactly like Python's round(), which np.round gets wrong on some half-cents"""
+    values = np.asarray(values, dtype=np.float64)
+    scaled = values * 100
+    rounded = np.rint(scaled)
+
+    # x * 100 is inexact, so values within a few ulps of a half-cent are re-rounded with round()
+    distance = np.abs(scaled - rounded)
+    near_half = distance >= 0.5 - np.abs(scaled) * 1e-15
+    rounded /= 100
+    if near_half.any():
+        rounded[near_half] = [round(value, 2) for value in values[near_half].tolist()]
+    return rounded
+
+def _as_float_array(values, name: str) -> np.ndarray:
+    """Convert input to a float64 array and reject negative entries"""
+    arr = np.asarray(values, dtype=np.float64)
+    if np.any(arr < 0):
+        raise ValueError(f"{name} cannot be negative")
+    return arr
+
+def _as_int_array(values, name: str) -> np.ndarray:
+    """Convert fixed-point input to an int64 array and reject negative entries"""
+    arr = np.asarray(values)
+    if arr.dtype.kind not in 'iub':
+        raise TypeError(f"{name} must be integers in fixed-point mode")
+    arr = arr.astype(np.int64)
+    if np.any(arr < 0):
+        raise ValueError(f"{name} cannot be negative")
+    return arr
+
+def _schedule(tariff_type: str) -> TariffSchedule:
+    """Compiled schedule for a tariff id; unlike the single calculations, unknown ids are rejected"""
+    if tariff_type not in TARIFF_SCHEDULES:
+        raise ValueError(f"Unknown tariff_type {tariff_type!r}")
+    return TARIFF_SCHEDULES[tariff_type]
+
+def _by_schedule(tariff_type, shape: tuple, compute) -> dict:
+    """Run compute(schedule, index) per tariff in the batch and scatter its columns back by row"""
+    if isinstance(tariff_type, str):
+        return compute(_schedule(tariff_type), ...)
+
+    tariff_ids = np.broadcast_to(np.asarray(tariff_type), shape)
+    schedules = {tariff: _schedule(str(tariff)) for tariff in np.unique(tariff_ids)}
+    columns = {}
+    for tariff, schedule in schedules.items():
+        index = tariff_ids == tariff
+        for key, values in compute(schedule, index).items():
+            columns.setdefault(key, np.zeros(shape, dtype=np.asarray(values).dtype))[index] = values
+    return columns
+
+def _reverse_tiers(amount: np.ndarray, schedule: TariffSchedule) -> list:
+    """Vectorized tier split of calculateAmountFromUnits_reverse, before rounding"""
+    # Remove VAT first to get subtotal, non-positive amounts buy nothing
+    paid = amount > 0
+    subtotal = amount / (1 + VAT)
+
+    # Vectorized bisect of the cost breakpoints
+    tier = np.searchsorted(schedule.cost_starts[1:], subtotal, side='left')
+    partial = (subtotal - np.take(schedule.cost_starts, tier)) / np.take(schedule.rates, tier)
+
+    tiers = []
+    for i, (start, limit) in enumerate(zip(schedule.tier_starts, schedule.limits + (None,))):
+        full = 0.0 if limit is None else limit - start
+        tiers.append(np.where(paid & (tier >= i), np.where(tier == i, partial, full), 0.0))
+    return tiers
+
+def _tier_columns(tiers: list, schedule: TariffSchedule, round_values: bool) -> dict:
+    """Per-tier units and costs plus subtotal and VAT columns"""
+    costs = [units * rate for units, rate in zip(tiers, schedule.rates)]
+    subtotal = sum(costs)
+    columns = {}
+    for i, units in enumerate(tiers, 1):
+        columns[f'tier{i}_units'] = units
+    for i, cost in enumerate(costs, 1):
+        columns[f'tier{i}_cost'] = cost
+    columns['subtotal'] = subtotal
+    columns['vat_amount'] = subtotal * VAT
+    if round_values:
+        columns = {key: _round2(values) for key, values in columns.items()}
+    return columns
+
+def _payment_columns(tiers: list, amount: np.ndarray, units: np.ndarray, schedule: TariffSchedule) -> dict:
+    """Rounded columns for one payment, like the payment breakdowns of the scalar engine"""
+    columns = _tier_columns(tiers, schedule, True)
+    columns['total'] = np.where(amount > 0, _round2(amount), 0.0)
+    columns['total_units'] = np.where(amount > 0, _round2(units), 0.0)
+    return columns
+
+def batchAmountFromUnits(units, tariff_type='new') -> dict:
+    """Vectorized calculateAmountFromUnits returning one array per breakdown column"""
+    units = _as_float_array(units, "Units")
+
+    def compute(schedule: TariffSchedule, index) -> dict:
+        rows = units[index]
+
+        # Calculate tier usage
+        tiers = []
+        for start, limit in zip(schedule.tier_starts, schedule.limits):
+            tiers.append(np.clip(rows - start, 0, limit - start))
+        tiers.append(np.maximum(rows - schedule.tier_starts[-1], 0))
+
+        columns = _tier_columns(tiers, schedule, False)
+        columns['total'] = _round2(columns['subtotal'] + columns['vat_amount'])
+        columns['total_units'] = rows
+        return columns
+
+    return _by_schedule(tariff_type, units.shape, compute)
+
+def batchUnitsFromAmount(amount, initial_amount=0, tariff_type='new', payment_columns: bool = False) -> dict:
+    """Vectorized calculateUnitsFromAmount returning one array per breakdown column
+
+    With payment_columns=True the initial/new payment breakdowns are added as
+    'initial_*' and 'new_*' columns.
+    """
+    amount = _as_float_array(amount, "Amount")
+    initial_amount = _as_float_array(initial_amount, "Initial amount")
+    amount, initial_amount = np.broadcast_arrays(amount, initial_amount)
+
+    def compute(schedule: TariffSchedule, index) -> dict:
+        new_amount = amount[index]
+        initial = initial_amount[index]
+
+        # Split the initial payment and the combined total; the new payment buys the difference
+        total_available = new_amount + initial
+        initial_tiers = _reverse_tiers(initial, schedule)
+        total_tiers = _reverse_tiers(total_available, schedule)
+        total_units = sum(total_tiers)
+
+        columns = _tier_columns(total_tiers, schedule, True)
+        columns['total'] = _round2(total_available)
+        columns['total_units'] = _round2(total_units)
+        columns['initial_amount'] = initial
+        columns['new_amount'] = new_amount
+
+        if payment_columns:
+            initial_units = sum(initial_tiers)
+            new_tiers = [total - part for total, part in zip(total_tiers, initial_tiers)]
+            for key, values in _payment_columns(initial_tiers, initial, initial_units, schedule).items():
+                columns[f'initial_{key}'] = values
+            for key, values in _payment_columns(new_tiers, new_amount, total_units - initial_units, schedule).items():
+                columns[f'new_{key}'] = values
+        return columns
+
+    return _by_schedule(tariff_type, amount.shape, compute)
+
+def _fixed_tier_columns(tier_wh: list, schedule: TariffSchedule) -> dict:
+    """Per-tier Wh and centimes plus subtotal and VAT, rounded by engine.fixed_charges"""
+    tier_milli = [wh * int(rate) for wh, rate in zip(tier_wh, schedule.rates)]
+    subtotal, vat_amount = fixed_charges(sum(tier_milli))
+    columns = {}
+    for i, wh in enumerate(tier_wh, 1):
+        columns[f'tier{i}_wh'] = wh
+    for i, milli in enumerate(tier_milli, 1):
+        columns[f'tier{i}_cost'] = fixed_charges(milli)[0]
+    columns['subtotal'] = subtotal
+    columns['vat_amount'] = vat_amount
+    return columns
+
+def batchAmountFromUnits_fixed(wh, tariff_type='new') -> dict:
+    """Vectorized calculateAmountFromUnits_fixed: int64 Wh in, int64 centimes out"""
+    wh = _as_int_array(wh, "Energy (Wh)")
+
+    def compute(schedule: TariffSchedule, index) -> dict:
+        rows = wh[index]
+        tiers = [np.clip(rows - start, 0, limit - start) for start, limit in zip(schedule.wh_starts, schedule.wh_limits)]
+        tiers.append(np.maximum(rows - schedule.wh_starts[-1], 0))
+
+        columns = _fixed_tier_columns(tiers, schedule)
+        columns['total'] = columns['subtotal'] + columns['vat_amount']
+        columns['total_wh'] = rows
+        return columns
+
+    return _by_schedule(tariff_type, wh.shape, compute)
+
+def _fixed_reverse_tiers(centimes: np.ndarray, schedule: TariffSchedule) -> list:
+    """Vectorized schedule.tier_wh_for_milli for VAT-inclusive payments in centimes"""
+    milli = fixed_subtotal_for_payment(centimes) * 10
+    tier = np.searchsorted(schedule.milli_starts[1:], milli, side='left')
+    rates = np.array(schedule.rates, dtype=np.int64)
+    partial = (milli - np.take(schedule.milli_starts, tier)) // np.take(rates, tier)
+
+    tiers = []
+    for i, (start, limit) in enumerate(zip(schedule.wh_starts, schedule.wh_limits + (None,))):
+        full = 0 if limit is None else limit - start
+        tiers.append(np.where(tier > i, full, np.where(tier == i, partial, 0)))
+    return tiers
+
+def batchUnitsFromAmount_fixed(amount, initial_amount=0, tariff_type='new') -> dict:
+    """Vectorized calculateUnitsFromAmount_fixed: int64 centimes in, int64 Wh out (rounded down)"""
+    amount = _as_int_array(amount, "Amount (centimes)")
+    initial_amount = _as_int_array(initial_amount, "Initial amount (centimes)")
+    amount, initial_amount = np.broadcast_arrays(amount, initial_amount)
+
+    def compute(schedule: TariffSchedule, index) -> dict:
+        new_amount = amount[index]
+        initial = initial_amount[index]
+        total_available = new_amount + initial
+        initial_wh = sum(_fixed_reverse_tiers(initial, schedule))
+        total_tiers = _fixed_reverse_tiers(total_available, schedule)
+        total_wh = sum(total_tiers)
+
+        columns = _fixed_tier_columns(total_tiers, schedule)
+        columns['total'] = total_available
+        columns['initial_amount'] = initial
+        columns['new_amount'] = new_amount
+        columns['total_wh'] = total_wh
+        columns['initial_wh'] = initial_wh
+        columns['new_wh'] = total_wh - initial_wh
+        return columns
+
+    return _by_schedule(tariff_type, amount.shape, compute)
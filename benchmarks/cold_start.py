@@ -0,0 +1,87 @@
+"""Cold-start cost of the Netlify function: import time and first-request latency
+
+    python benchmarks/cold_start.py --runs 5
+
+Every run is a fresh interpreter. Import time comes from `python -X importtime`
+(the module's cumulative time plus the slowest imports under it); first-request
+latency is measured inside the subprocess from interpreter start to the first
+handler() response for GET /, then a warm second request for comparison.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTION_DIR = os.path.join(ROOT, 'netlify', 'functions')
+
+# Runs in the subprocess; time.perf_counter() there starts near interpreter start-up
+FIRST_REQUEST = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+event = {
+    'httpMethod': 'GET', 'path': '/', 'resource': '/', 'headers': {'host': 'localhost'},
+    'multiValueHeaders': {}, 'queryStringParameters': None, 'multiValueQueryStringParameters': None,
+    'pathParameters': None, 'stageVariables': None, 'body': None, 'isBase64Encoded': False,
+    'requestContext': {'resourcePath': '/', 'httpMethod': 'GET', 'path': '/', 'stage': 'prod',
+                       'identity': {'sourceIp': '127.0.0.1'}},
+}
+status = app.handler(event, None)['statusCode']
+first = time.perf_counter()
+app.handler(event, None)
+second = time.perf_counter()
+print(json.dumps({'status': status, 'import_ms': (imported - start) * 1e3,
+                  'first_request_ms': (first - imported) * 1e3, 'warm_request_ms': (second - first) * 1e3}))
+"""
+
+def import_times(module: str = 'app', top: int = 10) -> dict:
+    """Cumulative import time of module and its slowest nested imports, in ms"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=FUNCTION_DIR, capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        rows.append((name.strip(), int(cumulative_us) / 1e3))
+    total = next(cumulative for name, cumulative in rows if name == module)
+    slowest = sorted(((name, cumulative) for name, cumulative in rows if name != module),
+                     key=lambda row: row[1], reverse=True)[:top]
+    return {'total_ms': total, 'slowest': slowest}
+
+def first_request() -> dict:
+    result = subprocess.run([sys.executable, '-c', FIRST_REQUEST], cwd=FUNCTION_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.splitlines()[-1])
+
+def benchmark(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="fresh interpreters per measurement (default 5)")
+    parser.add_argument('--json', help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    imports = [import_times() for _ in range(args.runs)]
+    requests = [first_request() for _ in range(args.runs)]
+    results = {
+        'import_ms': statistics.median(run['total_ms'] for run in imports),
+        'first_request_ms': statistics.median(run['first_request_ms'] for run in requests),
+        'warm_request_ms': statistics.median(run['warm_request_ms'] for run in requests),
+        'slowest_imports_ms': imports[-1]['slowest'],
+    }
+
+    print(f"import app:          {results['import_ms']:8.1f} ms (median of {args.runs})")
+    print(f"first request:       {results['first_request_ms']:8.1f} ms")
+    print(f"warm request:        {results['warm_request_ms']:8.1f} ms")
+    print("slowest imports (cumulative ms):")
+    for name, ms in results['slowest_imports_ms']:
+        print(f"  {ms:8.1f}  {name}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,53 @@
+"""Requests/sec on /calculate-units-live with precompiled breakdown templates vs FT trees
+
+    python benchmarks/fragments.py --requests 3000
+
+The fragment cache is disabled and every request uses different amounts, so each
+one renders its breakdown tables.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from starlette.testclient import TestClient
+
+import main
+import views
+
+def run(client: TestClient, urls: list, templates: bool) -> float:
+    """Requests per second for urls with BREAKDOWN_TEMPLATES set to templates"""
+    views.BREAKDOWN_TEMPLATES = templates
+    for url in urls[:100]:
+        client.get(url, headers={'HX-Request': 'true'})
+    start = time.perf_counter()
+    for url in urls:
+        client.get(url, headers={'HX-Request': 'true'})
+    return len(urls) / (time.perf_counter() - start)
+
+def benchmark(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=3000, help="requests per run (default 3000)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    urls = []
+    for _ in range(args.requests):
+        amount = round(random.uniform(100, 50_000), 2)
+        initial = random.choice([0, round(random.uniform(100, 10_000), 2)])
+        tariff = random.choice(['new', 'old'])
+        urls.append(f'/calculate-units-live?amount={amount}&initial_amount={initial}&tariff_type={tariff}')
+
+    main.fragment_cache.maxsize = 0
+    client = TestClient(main.app)
+    before = run(client, urls, templates=False)
+    after = run(client, urls, templates=True)
+    print(f"FT trees:           {before:8.0f} req/s")
+    print(f"string templates:   {after:8.0f} req/s  ({after / before:.2f}x)")
+
+if __name__ == '__main__':
+    benchmark()
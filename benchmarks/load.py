@@ -0,0 +1,337 @@
+"""Load test the live calculator routes with keystroke-shaped traffic
+
+    python benchmarks/load.py --concurrency 50 --duration 20
+    python benchmarks/load.py --start --workers 2 --concurrency 500 --json load.json
+    python benchmarks/load.py --url http://localhost:8000 --tariff-mix new=0.9,old=0.1
+
+Each virtual user types numbers into the page's fields the way HTMX reports them:
+a request for the pauses within a number (--pause-rate) and one for the finished
+value, then now and then a tariff switch that resends every field to
+/update-tariff. Requests go to --url, to a serve.py started for the run with
+--start, or by default straight to the ASGI app in this process. The report has
+throughput, p50/p95/p99/max latency and error rates overall and per route, as JSON.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HX_HEADERS = {'HX-Request': 'true'}
+
+class HttpClient:
+    """One keep-alive HTTP/1.1 connection, like a browser tab's"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def get(self, target: str) -> tuple[int, dict, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = ''.join(f'{name}: {value}\r\n' for name, value in HX_HEADERS.items())
+        self.writer.write(f'GET {target} HTTP/1.1\r\nHost: {self.host}\r\n{head}\r\n'.encode())
+        try:
+            lines = (await self.reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+            status = int(lines[0].split()[1])
+            headers = {}
+            for line in lines[1:]:
+                if line:
+                    name, _, value = line.partition(':')
+                    headers[name.strip().lower()] = value.strip()
+            if headers.get('transfer-encoding') == 'chunked':
+                body = b''
+                while size := int((await self.reader.readline()).split(b';')[0], 16):
+                    body += await self.reader.readexactly(size)
+                    await self.reader.readline()
+                await self.reader.readline()
+            else:
+                body = await self.reader.readexactly(int(headers.get('content-length', 0)))
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.close()
+            raise
+        if headers.get('connection') == 'close':
+            self.close()
+        return status, headers, body
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+class AsgiClient:
+    """Calls the ASGI app directly; no sockets, the app runs on this event loop"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def get(self, target: str) -> tuple[int, dict, bytes]:
+        path, _, query = target.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            'headers': [(b'host', b'localhost')] + [(name.lower().encode(), value.encode()) for name, value in HX_HEADERS.items()],
+        }
+        response = {'status': 0, 'headers': {}, 'body': []}
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = {name.decode().lower(): value.decode() for name, value in message.get('headers', [])}
+            elif message['type'] == 'http.response.body':
+                response['body'].append(message.get('body', b''))
+
+        await self.app(scope, receive, send)
+        return response['status'], response['headers'], b''.join(response['body'])
+
+    def close(self):
+        pass
+
+def parse_mix(text: str) -> dict:
+    """'new=0.8,old=0.2' -> weights normalized to sum to 1"""
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        weights[name.strip()] = float(weight or 1)
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError("Tariff mix weights must sum to more than zero")
+    return {name: weight / total for name, weight in weights.items()}
+
+def typed_number(rng: random.Random, low: float, high: float) -> str:
+    """A number a user would type, log-uniform between low and high, sometimes with decimals"""
+    value = math.exp(rng.uniform(math.log(low), math.log(high)))
+    if rng.random() < 0.2:
+        return f'{value:.1f}'.rstrip('0').rstrip('.')
+    return str(round(value))
+
+def keystrokes(text: str, rng: random.Random, pause_rate: float) -> list:
+    """Values HTMX sends while text is typed: the finished value and the pauses on the way"""
+    prefixes = [text[:i] for i in range(1, len(text)) if not text[:i].endswith('.') and rng.random() < pause_rate]
+    return prefixes + [text]
+
+class Session:
+    """One user's page: its field values and the requests their edits trigger"""
+
+    def __init__(self, rng: random.Random, tariff_mix: dict, pause_rate: float):
+        self.rng = rng
+        self.tariff_mix = tariff_mix
+        self.pause_rate = pause_rate
+        self.fields = {'amount': '', 'initial_amount': '', 'units': ''}
+        self.tariff_type = self.pick_tariff()
+
+    def pick_tariff(self) -> str:
+        return self.rng.choices(list(self.tariff_mix), weights=list(self.tariff_mix.values()))[0]
+
+    def cost(self) -> str:
+        return '/calculate-cost-live?' + urlencode({'units': self.fields['units'], 'tariff_type': self.tariff_type})
+
+    def units(self) -> str:
+        return '/calculate-units-live?' + urlencode({'amount': self.fields['amount'], 'initial_amount': self.fields['initial_amount'],
+                                                     'tariff_type': self.tariff_type})
+
+    def update_tariff(self) -> str:
+        return '/update-tariff?' + urlencode({'tariff_type': self.tariff_type, **self.fields})
+
+    def edits(self):
+        """Endless request targets for this user"""
+        while True:
+            choice = self.rng.random()
+            if choice < 0.4:
+                for value in keystrokes(typed_number(self.rng, 1, 2_000), self.rng, self.pause_rate):
+                    self.fields['units'] = value
+                    yield self.cost()
+            elif choice < 0.9:
+                field = 'initial_amount' if choice > 0.8 else 'amount'
+                for value in keystrokes(typed_number(self.rng, 200, 200_000), self.rng, self.pause_rate):
+                    self.fields[field] = value
+                    yield self.units()
+            else:
+                self.tariff_type = self.pick_tariff()
+                yield self.update_tariff()
+
+class Recorder:
+    """Latencies and outcomes per route"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.statuses = {}
+        self.failures = {}
+
+    def record(self, target: str, seconds: float, status: int | None, error: str | None = None):
+        route = target.partition('?')[0]
+        self.latencies.setdefault(route, []).append(seconds)
+        if error is None:
+            self.statuses.setdefault(route, {}).setdefault(status, 0)
+            self.statuses[route][status] += 1
+        else:
+            self.failures.setdefault(route, {}).setdefault(error, 0)
+            self.failures[route][error] += 1
+
+def latency_summary(seconds: list) -> dict:
+    """Nearest-rank percentiles in milliseconds"""
+    if not seconds:
+        return {}
+    ordered = sorted(seconds)
+
+    def percentile(p):
+        return round(ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)] * 1000, 3)
+
+    return {'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99),
+            'max': round(ordered[-1] * 1000, 3), 'mean': round(sum(ordered) / len(ordered) * 1000, 3)}
+
+def summary(recorder: Recorder, elapsed: float) -> dict:
+    def stats(latencies, statuses, failures):
+        count = len(latencies)
+        errors = sum(failures.values()) + sum(n for status, n in statuses.items() if status >= 400)
+        return {
+            'requests': count,
+            'throughput_rps': round(count / elapsed, 1) if elapsed else 0,
+            'latency_ms': latency_summary(latencies),
+            'errors': errors,
+            'error_rate': round(errors / count, 5) if count else 0,
+            'status': {str(status): n for status, n in sorted(statuses.items())},
+            'failures': failures,
+        }
+
+    routes = sorted(recorder.latencies)
+    report = stats([s for route in routes for s in recorder.latencies[route]],
+                   _merge([recorder.statuses.get(route, {}) for route in routes]),
+                   _merge([recorder.failures.get(route, {}) for route in routes]))
+    report['routes'] = {route: stats(recorder.latencies[route], recorder.statuses.get(route, {}), recorder.failures.get(route, {}))
+                        for route in routes}
+    return report
+
+def _merge(counters: list) -> dict:
+    merged = {}
+    for counter in counters:
+        for key, count in counter.items():
+            merged[key] = merged.get(key, 0) + count
+    return merged
+
+async def user(client, session: Session, recorder: Recorder, deadline: float, think: float, timeout: float):
+    """Send one user's requests back to back (after think seconds each) until the deadline"""
+    for target in session.edits():
+        if time.perf_counter() >= deadline:
+            break
+        start = time.perf_counter()
+        try:
+            status, headers, _ = await asyncio.wait_for(client.get(target), timeout)
+            # Browsers follow the canonical-query redirects transparently
+            if status in (301, 302, 307, 308) and 'location' in headers:
+                recorder.record(target, time.perf_counter() - start, status)
+                target, start = headers['location'], time.perf_counter()
+                status, headers, _ = await asyncio.wait_for(client.get(target), timeout)
+            recorder.record(target, time.perf_counter() - start, status)
+        except asyncio.TimeoutError:
+            client.close()
+            recorder.record(target, time.perf_counter() - start, None, 'timeout')
+        except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+            recorder.record(target, time.perf_counter() - start, None, type(e).__name__)
+            await asyncio.sleep(0.01)
+        if think:
+            await asyncio.sleep(think * session.rng.uniform(0.5, 1.5))
+    client.close()
+
+async def run(make_client, concurrency: int, duration: float, tariff_mix: dict, pause_rate: float = 0.4,
+              think: float = 0.0, timeout: float = 10.0, warmup: float = 1.0, seed: int = 0) -> dict:
+    """Drive concurrency users for warmup + duration seconds; only the last duration counts"""
+    if warmup:
+        await _users(make_client, concurrency, warmup, tariff_mix, pause_rate, think, timeout, seed + 1, Recorder())
+    recorder = Recorder()
+    start = time.perf_counter()
+    await _users(make_client, concurrency, duration, tariff_mix, pause_rate, think, timeout, seed, recorder)
+    return summary(recorder, time.perf_counter() - start)
+
+async def _users(make_client, concurrency, duration, tariff_mix, pause_rate, think, timeout, seed, recorder):
+    deadline = time.perf_counter() + duration
+    await asyncio.gather(*[
+        user(make_client(), Session(random.Random(seed * 100_003 + i), tariff_mix, pause_rate), recorder, deadline, think, timeout)
+        for i in range(concurrency)
+    ])
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(workers: int) -> tuple[subprocess.Popen, str]:
+    """Start serve.py on a free local port and wait until it accepts connections"""
+    port = _free_port()
+    env = {**os.environ, 'PORT': str(port), 'HOST': '127.0.0.1', 'WEB_CONCURRENCY': str(workers)}
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, 'serve.py')], env=env, cwd=ROOT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("serve.py did not start")
+
+def benchmark(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument('--url', help="base URL of a running server (default: the ASGI app in this process)")
+    target.add_argument('--start', action='store_true', help="start serve.py on a free port for the run")
+    parser.add_argument('--workers', type=int, default=1, help="WEB_CONCURRENCY for --start (default 1)")
+    parser.add_argument('--concurrency', type=int, default=50, help="simultaneous users, one connection each (default 50)")
+    parser.add_argument('--duration', type=float, default=10.0, help="measured seconds (default 10)")
+    parser.add_argument('--warmup', type=float, default=1.0, help="unmeasured seconds first (default 1)")
+    parser.add_argument('--tariff-mix', default='new=0.8,old=0.2', help="tariff_type weights (default new=0.8,old=0.2)")
+    parser.add_argument('--pause-rate', type=float, default=0.4, help="chance of a request for each partly typed value (default 0.4)")
+    parser.add_argument('--think', type=float, default=0.0, help="mean seconds a user waits between requests (default 0)")
+    parser.add_argument('--timeout', type=float, default=10.0, help="seconds before a request counts as failed (default 10)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="also write the report to this file")
+    args = parser.parse_args(argv)
+
+    process = None
+    if args.start:
+        process, args.url = start_server(args.workers)
+    try:
+        if args.url:
+            parts = urlsplit(args.url)
+            make_client = lambda: HttpClient(parts.hostname, parts.port or 80)
+        else:
+            import main
+            make_client = lambda: AsgiClient(main.app)
+        tariff_mix = parse_mix(args.tariff_mix)
+        report = asyncio.run(run(make_client, args.concurrency, args.duration, tariff_mix, args.pause_rate,
+                                 args.think, args.timeout, args.warmup, args.seed))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    report = {'target': args.url or 'in-process', 'concurrency': args.concurrency, 'duration_s': args.duration,
+              'tariff_mix': tariff_mix, 'pause_rate': args.pause_rate, 'think_s': args.think, **report}
+    print(json.dumps(report, indent=2))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == '__main__':
+    benchmark()
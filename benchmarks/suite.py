@@ -0,0 +1,193 @@
+"""Benchmarks for the tariff engine, the renderers and the HTTP routes
+
+    python benchmarks/suite.py run --save benchmarks/baseline.json
+    python benchmarks/suite.py run --save current.json --filter engine
+    python benchmarks/suite.py compare benchmarks/baseline.json current.json --threshold 0.15
+
+run times every benchmark (median and best of several repeats, in microseconds
+per call) and can save the results as JSON; compare reports the change per
+benchmark and exits non-zero when any got slower by more than the threshold.
+Engine benchmarks also record their allocations with tracemalloc: the bytes each
+result keeps alive and the peak a single call allocates along the way.
+Routes go through Starlette's TestClient with the fragment cache disabled unless
+the benchmark name says 'cached'.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _cycle(values):
+    """Callable returning the next value of an endless cycle, so repeated calls miss caches"""
+    return itertools.cycle(values).__next__
+
+def benchmarks() -> dict:
+    """Benchmark name -> zero-argument callable"""
+    from fasthtml.common import fh_cfg, to_xml
+    from starlette.testclient import TestClient
+
+    import main
+    from engine import (calculateAmountFromUnits, calculateAmountFromUnits_reverse,
+                        calculateAmountFromUnits_withOffset, calculateUnitsFromAmount)
+
+    units = _cycle([7.5, 18.25, 35.0, 49.99, 73.1, 250.0, 1234.56])
+    off_grid_units = _cycle([7.5003, 18.2501, 35.0007, 73.1009, 250.0004])
+    amounts = _cycle([1500.0, 6200.5, 12345.67, 40000.0, 250000.25])
+    cost_breakdown = calculateAmountFromUnits(73.1)[1]
+    single_breakdown = calculateUnitsFromAmount(12345.67)[1]
+    dual_breakdown = calculateUnitsFromAmount(12345.67, 2500)[1]
+
+    client = TestClient(main.app)
+    hx = {'HX-Request': 'true'}
+    cost_urls = _cycle([f'/calculate-cost-live?units={u}&tariff_type={t}' for u in range(1, 400, 7) for t in ('new', 'old')])
+    units_urls = _cycle([f'/calculate-units-live?amount={a}&initial_amount={i}&tariff_type={t}'
+                         for a in range(500, 60_000, 1_300) for i in (0, 2500) for t in ('new', 'old')])
+    tariff_urls = _cycle([f'/update-tariff?tariff_type={t}&amount={a}&initial_amount=1000&units={a // 100}'
+                          for a in range(500, 60_000, 1_300) for t in ('new', 'old')])
+
+    return {
+        'engine.calculateAmountFromUnits': lambda: calculateAmountFromUnits(units()),
+        'engine.calculateAmountFromUnits.off_grid': lambda: calculateAmountFromUnits(off_grid_units()),
+        'engine.calculateUnitsFromAmount': lambda: calculateUnitsFromAmount(amounts()),
+        'engine.calculateUnitsFromAmount.initial': lambda: calculateUnitsFromAmount(amounts(), 2500),
+        'engine.calculateAmountFromUnits_reverse': lambda: calculateAmountFromUnits_reverse(amounts()),
+        'engine.calculateAmountFromUnits_withOffset': lambda: calculateAmountFromUnits_withOffset(amounts(), 17.5),
+        'engine.Breakdown.getitem.tier': lambda: dual_breakdown['tier2_cost'],
+        'engine.Breakdown.getitem.total_units': lambda: dual_breakdown['total_units'],
+        'render.create_breakdown_table.cost': lambda: to_xml(main.create_breakdown_table(cost_breakdown), indent=fh_cfg.indent),
+        'render.create_breakdown_table.dual': lambda: to_xml(main.create_breakdown_table(dual_breakdown), indent=fh_cfg.indent),
+        'render.render_breakdown_table.units': lambda: main.render_breakdown_table(single_breakdown, 2),
+        'render.render_breakdown_table.dual': lambda: main.render_breakdown_table(dual_breakdown, 2),
+        'render.index_page': lambda: to_xml(main.index_page(), indent=fh_cfg.indent),
+        'route./': lambda: client.get('/'),
+        'route./calculate-cost-live': lambda: client.get(cost_urls(), headers=hx),
+        'route./calculate-units-live': lambda: client.get(units_urls(), headers=hx),
+        'route./calculate-units-live.cached': lambda: client.get('/calculate-units-live?amount=5000&initial_amount=0&tariff_type=new', headers=hx),
+        'route./update-tariff': lambda: client.get(tariff_urls(), headers=hx),
+    }
+
+def measure(func, repeat: int = 5, min_time: float = 0.2) -> dict:
+    """Median and best microseconds per call over repeat runs of about min_time seconds each"""
+    timer = timeit.Timer(func)
+    timer.timeit(1)
+    number, elapsed = 1, timer.timeit(1)
+    while elapsed < min_time / 10:
+        number *= 10
+        elapsed = timer.timeit(number)
+    number = max(1, round(number * min_time / elapsed))
+    runs = [timer.timeit(number) / number * 1e6 for _ in range(repeat)]
+    return {'median_us': round(statistics.median(runs), 3), 'min_us': round(min(runs), 3), 'calls': number}
+
+# Benchmarks whose allocations are measured as well; route and render ones allocate in Starlette and FastHTML
+ALLOCATION_PREFIXES = ('engine.',)
+
+def measure_allocations(func, calls: int = 1000) -> dict:
+    """Bytes retained per call when every result is kept, and the peak bytes of a single call"""
+    func()
+    kept = [None] * calls
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        for i in range(calls):
+            kept[i] = func()
+        retained = tracemalloc.get_traced_memory()[0] - start
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        func()
+        peak = tracemalloc.get_traced_memory()[1] - start
+    finally:
+        tracemalloc.stop()
+    return {'retained_bytes': round(retained / calls), 'peak_bytes': peak}
+
+def run(names_filter: str = '', repeat: int = 5, min_time: float = 0.2) -> dict:
+    import main
+
+    cache_size = main.fragment_cache.maxsize
+    results = {}
+    try:
+        for name, func in benchmarks().items():
+            if names_filter not in name:
+                continue
+            main.fragment_cache.maxsize = cache_size if 'cached' in name else 0
+            main.fragment_cache.clear()
+            results[name] = measure(func, repeat, min_time)
+            line = f"{name:50s} {results[name]['median_us']:12.2f} us  (best {results[name]['min_us']:.2f})"
+            if name.startswith(ALLOCATION_PREFIXES):
+                results[name].update(measure_allocations(func))
+                line += f"  {results[name]['retained_bytes']} B kept, {results[name]['peak_bytes']} B peak"
+            print(line)
+    finally:
+        main.fragment_cache.maxsize = cache_size
+    return {
+        'meta': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'repeat': repeat, 'min_time': min_time},
+        'results': results,
+    }
+
+def compare(baseline: dict, current: dict, threshold: float = 0.10) -> list:
+    """Print the change per benchmark and return the names that regressed by more than threshold"""
+    regressions = []
+    for name, result in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print(f"{name:50s} {result['median_us']:12.2f} us  (new)")
+            continue
+        change = result['median_us'] / base['median_us'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        allocations = ''
+        if 'peak_bytes' in base and 'peak_bytes' in result:
+            allocations = f"  peak {base['peak_bytes']} -> {result['peak_bytes']} B"
+        print(f"{name:50s} {base['median_us']:12.2f} -> {result['median_us']:10.2f} us  {change:+7.1%}{allocations}{flag}")
+    return regressions
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+def benchmark(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('--save', help="write the results to this JSON file")
+    run_parser.add_argument('--compare', help="compare against this baseline JSON after running")
+    run_parser.add_argument('--filter', default='', help="only benchmarks whose name contains this")
+    run_parser.add_argument('--repeat', type=int, default=5, help="timed runs per benchmark (default 5)")
+    run_parser.add_argument('--min-time', type=float, default=0.2, help="seconds per timed run (default 0.2)")
+    run_parser.add_argument('--threshold', type=float, default=0.10, help="regression threshold for --compare (default 0.10)")
+    compare_parser = commands.add_parser('compare', help="compare two saved results")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10, help="slowdown that counts as a regression (default 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        current = run(args.filter, args.repeat, args.min_time)
+        if args.save:
+            with open(args.save, 'w') as f:
+                json.dump(current, f, indent=2)
+        if not args.compare:
+            return 0
+        baseline = _load(args.compare)
+    else:
+        baseline, current = _load(args.baseline), _load(args.current)
+
+    print()
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(benchmark())
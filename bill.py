@@ -0,0 +1,229 @@
+"""Bill a file of meter readings with the batch tariff engine
+
+    python bill.py readings.csv breakdowns.csv
+    python bill.py readings.parquet breakdowns.parquet --workers 8 --chunk-size 200000
+
+Each input row has a meter_id, a tariff_type ('new' or 'old', default 'new') and
+either units (kWh consumed) or amount (RWF paid) with an optional initial_amount.
+The file is streamed in fixed-size chunks that are billed on a process pool, so
+memory stays flat however large the input is. Parquet needs pyarrow.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from batch import batchAmountFromUnits, batchUnitsFromAmount
+from engine import TARIFF_SCHEDULES
+
+INPUT_COLUMNS = ('meter_id', 'tariff_type', 'units', 'amount', 'initial_amount')
+MAX_TIERS = max(schedule.tiers for schedule in TARIFF_SCHEDULES.values())
+BREAKDOWN_COLUMNS = (
+    [f'tier{i}_units' for i in range(1, MAX_TIERS + 1)]
+    + [f'tier{i}_cost' for i in range(1, MAX_TIERS + 1)]
+    + ['subtotal', 'vat_amount', 'total', 'total_units']
+)
+OUTPUT_COLUMNS = list(INPUT_COLUMNS) + BREAKDOWN_COLUMNS + ['error']
+
+def _parse(value: str) -> float | None:
+    """Parse an optional number, None for an empty cell; ValueError for nan and infinities"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("Values must be finite numbers")
+    return number
+
+def bill_chunk(rows: list) -> tuple[dict, dict]:
+    """Bill one chunk of (meter_id, tariff_type, units, amount, initial_amount) rows
+
+    Returns the output columns and the chunk's contribution to the summary.
+    """
+    count = len(rows)
+    columns = {name: [row[i] for row in rows] for i, name in enumerate(INPUT_COLUMNS)}
+    columns['tariff_type'] = [tariff or 'new' for tariff in columns['tariff_type']]
+    columns['error'] = [''] * count
+    for name in BREAKDOWN_COLUMNS:
+        columns[name] = np.full(count, np.nan)
+
+    # Route each row to the cost or the units calculation
+    cost_rows, units_rows = [], []
+    units, amounts, initial_amounts = [], [], []
+    for i, (_, _, units_text, amount_text, initial_text) in enumerate(rows):
+        try:
+            if columns['tariff_type'][i] not in TARIFF_SCHEDULES:
+                raise ValueError(f"Unknown tariff_type {columns['tariff_type'][i]!r}")
+            units_val = _parse(units_text)
+            amount_val = _parse(amount_text)
+            initial_val = _parse(initial_text) or 0
+            if units_val is not None:
+                if units_val < 0:
+                    raise ValueError("Units cannot be negative")
+                cost_rows.append(i)
+                units.append(units_val)
+            elif amount_val is not None:
+                if amount_val < 0 or initial_val < 0:
+                    raise ValueError("Amount cannot be negative")
+                units_rows.append(i)
+                amounts.append(amount_val)
+                initial_amounts.append(initial_val)
+            else:
+                raise ValueError("Row needs units or amount")
+        except ValueError as e:
+            columns['error'][i] = str(e)
+
+    tariffs = np.array(columns['tariff_type'])
+    for index, result in (
+        (cost_rows, batchAmountFromUnits(units, tariffs[cost_rows]) if cost_rows else {}),
+        (units_rows, batchUnitsFromAmount(amounts, initial_amounts, tariffs[units_rows]) if units_rows else {}),
+    ):
+        for name in BREAKDOWN_COLUMNS:
+            if name in result:
+                columns[name][index] = result[name]
+
+    billed = ~np.isnan(columns['total'])
+    stats = {
+        'rows': count,
+        'cost_rows': len(cost_rows),
+        'units_rows': len(units_rows),
+        'invalid_rows': count - len(cost_rows) - len(units_rows),
+        'total_amount': float(columns['total'][billed].sum()),
+        'total_units': float(columns['total_units'][billed].sum()),
+        'vat_amount': float(columns['vat_amount'][billed].sum()),
+    }
+    return columns, stats
+
+def _read_csv(path: str, chunk_size: int):
+    """Yield lists of input rows from a CSV file with a header line"""
+    with (sys.stdin if path == '-' else open(path, newline='')) as f:
+        reader = csv.DictReader(f)
+        rows = ((r.get('meter_id', ''), r.get('tariff_type') or r.get('tariff', ''), r.get('units', ''),
+                 r.get('amount', ''), r.get('initial_amount', '')) for r in reader)
+        while chunk := list(islice(rows, chunk_size)):
+            yield chunk
+
+def _read_parquet(path: str, chunk_size: int):
+    """Yield lists of input rows from a Parquet file, one record batch at a time"""
+    import pyarrow.parquet as pq
+
+    parquet = pq.ParquetFile(path)
+    names = set(parquet.schema_arrow.names)
+    tariff_column = 'tariff_type' if 'tariff_type' in names else 'tariff'
+    for batch in parquet.iter_batches(batch_size=chunk_size):
+        data = batch.to_pydict()
+        count = batch.num_rows
+
+        def column(name):
+            values = data.get(name, [None] * count)
+            return ['' if value is None else str(value) for value in values]
+
+        yield list(zip(column('meter_id'), column(tariff_column), column('units'),
+                       column('amount'), column('initial_amount')))
+
+class CsvWriter:
+    def __init__(self, path: str):
+        self.file = sys.stdout if path == '-' else open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(OUTPUT_COLUMNS)
+
+    def write(self, columns: dict):
+        cells = []
+        for name in OUTPUT_COLUMNS:
+            values = columns[name]
+            if name in BREAKDOWN_COLUMNS:
+                values = ['' if value != value else f"{value:.2f}" for value in values.tolist()]
+            cells.append(values)
+        self.writer.writerows(zip(*cells))
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+class ParquetWriter:
+    def __init__(self, path: str):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema(
+            [(name, pa.string()) for name in INPUT_COLUMNS]
+            + [(name, pa.float64()) for name in BREAKDOWN_COLUMNS]
+            + [('error', pa.string())]
+        )
+        self.writer = pq.ParquetWriter(path, self.schema)
+
+    def write(self, columns: dict):
+        self.writer.write_table(self.pa.table({name: columns[name] for name in OUTPUT_COLUMNS}, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+def _is_parquet(path: str) -> bool:
+    return path.endswith(('.parquet', '.pq'))
+
+def run(input_path: str, output_path: str, chunk_size: int = 100_000, workers: int | None = None) -> dict:
+    """Bill input_path into output_path and return the summary"""
+    chunks = _read_parquet(input_path, chunk_size) if _is_parquet(input_path) else _read_csv(input_path, chunk_size)
+    writer = ParquetWriter(output_path) if _is_parquet(output_path) else CsvWriter(output_path)
+    workers = workers or os.cpu_count() or 1
+
+    summary = dict.fromkeys(['rows', 'cost_rows', 'units_rows', 'invalid_rows'], 0)
+    summary.update(dict.fromkeys(['total_amount', 'total_units', 'vat_amount'], 0.0))
+    start = time.perf_counter()
+
+    def collect(result):
+        columns, stats = result
+        writer.write(columns)
+        for key, value in stats.items():
+            summary[key] += value
+
+    try:
+        if workers == 1:
+            for chunk in chunks:
+                collect(bill_chunk(chunk))
+        else:
+            # Keep a bounded number of chunks in flight so memory stays flat; results are written in order
+            with ProcessPoolExecutor(workers) as pool:
+                pending = []
+                for chunk in chunks:
+                    pending.append(pool.submit(bill_chunk, chunk))
+                    if len(pending) >= workers * 2:
+                        collect(pending.pop(0).result())
+                for future in pending:
+                    collect(future.result())
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    summary['total_amount'] = round(summary['total_amount'], 2)
+    summary['total_units'] = round(summary['total_units'], 2)
+    summary['vat_amount'] = round(summary['vat_amount'], 2)
+    summary['seconds'] = round(elapsed, 3)
+    summary['rows_per_second'] = round(summary['rows'] / elapsed) if elapsed else 0
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help="meter readings (.csv or .parquet, '-' for stdin CSV)")
+    parser.add_argument('output', help="per-row breakdowns (.csv or .parquet, '-' for stdout CSV)")
+    parser.add_argument('--chunk-size', type=int, default=100_000, help="rows per chunk (default 100000)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument('--summary', help="also write the summary JSON to this file")
+    args = parser.parse_args(argv)
+
+    summary = run(args.input, args.output, args.chunk_size, args.workers)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,35 @@
 from fasthtml.common import *
+from starlette.testclient import TestClient
+from engine import TARIFF_SCHEDULES, TARIFF_TABLE_SCALES, TARIFF_TABLES_DIR, TariffTable, _amount_breakdown, VAT
 from main import app
 import os
 
+# Precomputed lookup table range: 0-10,000 kWh and payments up to 1,000,000 RWF
+TABLE_MAX_UNITS = 10_000
+TABLE_MAX_AMOUNT = 1_000_000
+
 # Create output directory
 os.makedirs('dist', exist_ok=True)
 
 # Generate static HTML for sample routes
 routes = ['/', '/calculate-cost?units=10', '/calculate-units?amount=10000']
 for route in routes:
-    response = app.test_client().get(route)
+    response = TestClient(app).get(route)
     file_name = 'index.html' if route == '/' else route.replace('/', '_').replace('?', '_') + '.html'
     with open(f'dist/{file_name}', 'w') as f:
-        f.write(response.text)
\ No newline at end of file
+        f.write(response.text)
+
+# Generate the memory-mapped lookup tables used by calculateAmountFromUnits / calculateUnitsFromAmount
+os.makedirs(TARIFF_TABLES_DIR, exist_ok=True)
+for tariff_type, schedule in TARIFF_SCHEDULES.items():
+    def cost_row(units, schedule=schedule):
+        tier_units, tier_costs, subtotal, vat_amount = _amount_breakdown(units, schedule)
+        return [*tier_units, *tier_costs, subtotal, vat_amount, round(subtotal + vat_amount, 2)]
+
+    def units_row(amount, schedule=schedule):
+        return schedule.tier_units_for_subtotal(amount / (1 + VAT))
+
+    scale = TARIFF_TABLE_SCALES['cost']
+    TariffTable.write(f'{TARIFF_TABLES_DIR}/{tariff_type}-cost.bin', schedule, 'cost', scale, TABLE_MAX_UNITS * scale + 1, cost_row)
+    scale = TARIFF_TABLE_SCALES['units']
+    TariffTable.write(f'{TARIFF_TABLES_DIR}/{tariff_type}-units.bin', schedule, 'units', scale, TABLE_MAX_AMOUNT * scale + 1, units_row)
@@ -0,0 +1,492 @@
+"""Tariff engine shared by the web app, the Netlify function, build.py and the batch tools
+
+Pure Python with no third-party imports, so every entry point can load it cheaply.
+"""
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+import contextlib
+import functools
+import mmap
+import os
+import re
+import struct
+import sys
+
+# Constants
+VAT = 0.18
+
+# Fixed-point units: money in centimes (1/100 RWF), energy in Wh (1/1000 kWh)
+CENTIMES_PER_RWF = 100
+WH_PER_KWH = 1000
+VAT_PERCENT = round(VAT * 100)
+
+# Tariff structures
+OLD_TARIFFS = {
+    'rates': (89, 212, 249),
+    'limits': (15, 50),
+    'description': '2020-2025 Tariffs'
+}
+
+NEW_TARIFFS = {
+    'rates': (89, 310, 369),
+    'limits': (20, 50),
+    'description': 'October 2025 Tariffs'
+}
+
+# Default to new tariffs
+CURRENT_TARIFFS = NEW_TARIFFS
+TIER_1, TIER_2, TIER_3 = CURRENT_TARIFFS['rates']
+TIER_1_LIMIT, TIER_2_LIMIT = CURRENT_TARIFFS['limits']
+
+@dataclass(frozen=True)
+class TariffSchedule:
+    """Tariff structure compiled once into cumulative unit and cost breakpoints"""
+    rates: tuple
+    limits: tuple
+    description: str
+    tier_starts: tuple  # units already used when each tier begins
+    cost_starts: tuple  # subtotal (before VAT) already charged when each tier begins
+    wh_limits: tuple    # limits in Wh for fixed-point mode
+    wh_starts: tuple    # tier_starts in Wh
+    milli_starts: tuple # cost_starts in milli-RWF; 1 Wh at r RWF/kWh costs exactly r milli-RWF
+    breakdown_keys: tuple  # tier units, tier costs, subtotal and vat_amount keys in breakdown order
+
+    @classmethod
+    def compile(cls, tariffs: dict) -> 'TariffSchedule':
+        """Precompute the breakpoints of a tariff dict like NEW_TARIFFS"""
+        rates = tuple(tariffs['rates'])
+        limits = tuple(tariffs['limits'])
+        if len(rates) != len(limits) + 1:
+            raise ValueError("A tariff needs exactly one more rate than limits")
+        if any(start >= limit for start, limit in zip((0,) + limits, limits)):
+            raise ValueError("Tariff limits must be positive and increasing")
+        
+        if any(rate != int(rate) for rate in rates) or any(limit * WH_PER_KWH != int(limit * WH_PER_KWH) for limit in limits):
+            raise ValueError("Tariff rates must be whole RWF/kWh and limits whole Wh")
+        
+        tier_starts = (0,) + limits
+        cost_starts = [0]
+        for rate, start, limit in zip(rates, tier_starts, limits):
+            cost_starts.append(cost_starts[-1] + (limit - start) * rate)
+        
+        wh_limits = tuple(int(limit * WH_PER_KWH) for limit in limits)
+        wh_starts = (0,) + wh_limits
+        milli_starts = [0]
+        for rate, start, limit in zip(rates, wh_starts, wh_limits):
+            milli_starts.append(milli_starts[-1] + (limit - start) * int(rate))
+        
+        breakdown_keys = (tuple(f'tier{i}_units' for i in range(1, len(rates) + 1))
+                          + tuple(f'tier{i}_cost' for i in range(1, len(rates) + 1))
+                          + ('subtotal', 'vat_amount'))
+        
+        return cls(rates, limits, tariffs['description'], tier_starts, tuple(cost_starts),
+                   wh_limits, wh_starts, tuple(milli_starts), breakdown_keys)
+
+    @property
+    def tiers(self) -> int:
+        return len(self.rates)
+
+    def tier_units(self, units: float) -> list:
+        """Split units across tiers, O(log tiers) to find the partially used tier"""
+        # Always floats, like the rows of the precomputed tables, so result types never depend on the grid
+        tier = bisect_left(self.limits, units)
+        full = [float(limit - start) for start, limit in zip(self.tier_starts[:tier], self.limits)]
+        return full + [float(units - self.tier_starts[tier])] + [0.0] * (self.tiers - tier - 1)
+
+    def tier_units_for_subtotal(self, subtotal: float) -> list:
+        """Split the units a subtotal (before VAT) buys across tiers, as floats like tier_units"""
+        tier = bisect_left(self.cost_starts, subtotal, 1) - 1
+        full = [float(limit - start) for start, limit in zip(self.tier_starts[:tier], self.limits)]
+        partial = (subtotal - self.cost_starts[tier]) / self.rates[tier]
+        return full + [partial] + [0.0] * (self.tiers - tier - 1)
+
+    def subtotal_for_units(self, units: float) -> float:
+        """Cost of units before VAT"""
+        tier = bisect_left(self.limits, units)
+        return self.cost_starts[tier] + (units - self.tier_starts[tier]) * self.rates[tier]
+
+    def units_for_subtotal(self, subtotal: float) -> float:
+        """Units bought by a subtotal (before VAT)"""
+        tier = bisect_left(self.cost_starts, subtotal, 1) - 1
+        return self.tier_starts[tier] + (subtotal - self.cost_starts[tier]) / self.rates[tier]
+
+    def tier_wh(self, wh: int) -> list:
+        """Integer version of tier_units, in Wh"""
+        tier = bisect_left(self.wh_limits, wh)
+        full = [limit - start for start, limit in zip(self.wh_starts[:tier], self.wh_limits)]
+        return full + [wh - self.wh_starts[tier]] + [0] * (self.tiers - tier - 1)
+
+    def tier_wh_for_milli(self, milli: int) -> list:
+        """Split the whole Wh a budget in milli-RWF buys across tiers, rounding energy down"""
+        tier = bisect_left(self.milli_starts, milli, 1) - 1
+        full = [limit - start for start, limit in zip(self.wh_starts[:tier], self.wh_limits)]
+        partial = (milli - self.milli_starts[tier]) // int(self.rates[tier])
+        return full + [partial] + [0] * (self.tiers - tier - 1)
+
+TARIFF_SCHEDULES = {
+    'new': TariffSchedule.compile(NEW_TARIFFS),
+    'old': TariffSchedule.compile(OLD_TARIFFS)
+}
+
+def get_schedule(tariff_type: str) -> TariffSchedule:
+    """Compiled schedule for a tariff type, anything unknown falls back to the old tariffs"""
+    return TARIFF_SCHEDULES.get(tariff_type, TARIFF_SCHEDULES['old'])
+
+def tariff_key(tariff_type: str) -> str:
+    """Tariff id as the engine resolves it, so unknown ids share the fallback's cache entries"""
+    return tariff_type if tariff_type in TARIFF_SCHEDULES else 'old'
+
+# Precomputed tables written by build.py: 'cost' rows hold the calculateAmountFromUnits
+# breakdown per 0.01 kWh, 'units' rows the tier split of each whole RWF payment
+TARIFF_TABLES_DIR = os.environ.get('TARIFF_TABLES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tables'))
+TARIFF_TABLE_SCALES = {'cost': 100, 'units': 1}
+
+class TariffTable:
+    """Engine results on a fixed grid, memory-mapped read-only so every worker process shares one page-cache copy"""
+    MAGIC = b'RWTABLE1'
+    HEADER = struct.Struct('<8sQQdQ')  # magic, rows, columns, grid points per unit, fingerprint length
+
+    def __init__(self, path: str, schedule: TariffSchedule, kind: str):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.rows, self.columns, self.scale, fingerprint_length = self.HEADER.unpack_from(self._mmap)
+        offset = self.HEADER.size + fingerprint_length
+        if magic != self.MAGIC or self._mmap[self.HEADER.size:offset] != self.fingerprint(schedule, kind, self.scale):
+            raise ValueError(f"{path} was built for a different tariff")
+        
+        offset += -offset % 8
+        self.schedule = schedule
+        self.values = memoryview(self._mmap)[offset:offset + self.rows * self.columns * 8].cast('d')
+
+    @staticmethod
+    def fingerprint(schedule: TariffSchedule, kind: str, scale: float) -> bytes:
+        return repr((kind, float(scale), schedule.rates, schedule.limits, VAT)).encode()
+
+    @classmethod
+    def write(cls, path: str, schedule: TariffSchedule, kind: str, scale: float, rows: int, row_values):
+        """Write a table; row_values(x) gives the columns for grid point x = i / scale"""
+        fingerprint = cls.fingerprint(schedule, kind, scale)
+        first = row_values(0.0)
+        # Build beside the live file and swap it in: running workers keep their mapping of the old inode
+        temp = f'{path}.{os.getpid()}.tmp'
+        try:
+            with open(temp, 'wb') as f:
+                header = cls.HEADER.pack(cls.MAGIC, rows, len(first), scale, len(fingerprint)) + fingerprint
+                f.write(header + bytes(-len(header) % 8))
+                f.write(struct.pack(f'<{len(first)}d', *first))
+                for i in range(1, rows):
+                    f.write(struct.pack(f'<{len(first)}d', *row_values(i / scale)))
+            os.replace(temp, path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp)
+            raise
+
+    def row(self, x: float) -> list | None:
+        """Columns for x if it lies on the grid, else None"""
+        scaled = x * self.scale
+        if not 0 <= scaled < self.rows:
+            return None
+        index = round(scaled)
+        if index < self.rows and index / self.scale == x:
+            start = index * self.columns
+            return self.values[start:start + self.columns].tolist()
+        return None
+
+def load_tariff_tables(directory: str = TARIFF_TABLES_DIR) -> dict:
+    """Map every table in directory that matches the current schedules; missing or stale ones are skipped"""
+    tables = {}
+    if sys.byteorder != 'little':
+        return tables
+    for tariff_type, schedule in TARIFF_SCHEDULES.items():
+        for kind in TARIFF_TABLE_SCALES:
+            path = os.path.join(directory, f'{tariff_type}-{kind}.bin')
+            try:
+                tables[kind, tariff_type] = TariffTable(path, schedule, kind)
+            except (OSError, ValueError, struct.error):
+                pass
+    return tables
+
+TARIFF_TABLES = load_tariff_tables()
+
+def _table_row(kind: str, tariff_type: str, schedule: TariffSchedule, x: float) -> list | None:
+    """Precomputed columns for x, or None when there is no table or the tariff has changed since it was built"""
+    table = TARIFF_TABLES.get((kind, tariff_type))
+    if table is None or table.schedule is not schedule:
+        return None
+    return table.row(x)
+
+@functools.lru_cache(maxsize=64)
+def _tier_field(key: str) -> tuple | None:
+    """('units' | 'cost', tier index) for a tier<N>_units or tier<N>_cost key, else None"""
+    match = re.fullmatch(r'tier([1-9][0-9]*)_(units|cost)', key)
+    return (match[2], int(match[1]) - 1) if match else None
+
+# Keys as_dict() only has for units-from-amount results
+_FROM_AMOUNT_KEYS = ('initial_amount', 'new_amount', 'total_units', 'initial_breakdown', 'new_breakdown', 'has_both_payments')
+
+class Breakdown:
+    """Slotted engine result; as_dict() gives the breakdown dict earlier versions returned"""
+    __slots__ = ('tier_units', 'tier_costs', 'subtotal', 'vat_amount', 'total', 'total_units',
+                 'schedule', 'tariff_type', 'initial_amount', 'new_amount', 'initial_breakdown', 'new_breakdown')
+
+    def __init__(self, tier_units: tuple, tier_costs: tuple, subtotal: float, vat_amount: float,
+                 total: float, total_units: float | None, schedule: TariffSchedule, tariff_type: str | None = None,
+                 initial_amount: float | None = None, new_amount: float | None = None,
+                 initial_breakdown: 'Breakdown | None' = None, new_breakdown: 'Breakdown | None' = None):
+        self.tier_units = tier_units
+        self.tier_costs = tier_costs
+        self.subtotal = subtotal
+        self.vat_amount = vat_amount
+        self.total = total
+        self.total_units = total_units
+        self.schedule = schedule
+        self.tariff_type = tariff_type
+        self.initial_amount = initial_amount
+        self.new_amount = new_amount
+        self.initial_breakdown = initial_breakdown
+        self.new_breakdown = new_breakdown
+
+    @property
+    def tariff_rates(self) -> tuple:
+        return self.schedule.rates
+
+    @property
+    def tariff_limits(self) -> tuple:
+        return self.schedule.limits
+
+    @property
+    def has_both_payments(self) -> bool:
+        return self.initial_amount is not None and self.initial_amount > 0 and self.new_amount > 0
+
+    def as_dict(self) -> dict:
+        """Breakdown as the dict with tier1_units ... tariff_limits keys"""
+        values = dict(zip(self.schedule.breakdown_keys, self.tier_units + self.tier_costs + (self.subtotal, self.vat_amount)))
+        values['total'] = self.total
+        if self.initial_amount is not None:
+            # Units from amount
+            values.update({
+                'initial_amount': self.initial_amount,
+                'new_amount': self.new_amount,
+                'total_units': self.total_units,
+                'initial_breakdown': self.initial_breakdown.as_dict() if self.initial_breakdown else None,
+                'new_breakdown': self.new_breakdown.as_dict() if self.new_breakdown else None,
+                'has_both_payments': self.has_both_payments
+            })
+        elif self.total_units is not None:
+            values['total_units'] = self.total_units
+        if self.tariff_type is not None:
+            values.update(tariff_type=self.tariff_type, tariff_rates=self.tariff_rates, tariff_limits=self.tariff_limits)
+        return values
+
+    def __getitem__(self, key: str):
+        """Dict-style access for callers written against the old breakdown dicts, same keys as as_dict()"""
+        if key in ('subtotal', 'vat_amount', 'total'):
+            return getattr(self, key)
+        tier = _tier_field(key)
+        if tier is not None:
+            kind, index = tier
+            values = self.tier_units if kind == 'units' else self.tier_costs
+            if index < len(values):
+                return values[index]
+        elif key in _FROM_AMOUNT_KEYS and self.initial_amount is not None:
+            value = getattr(self, key)
+            return value.as_dict() if isinstance(value, Breakdown) else value
+        elif key == 'total_units' and self.total_units is not None:
+            return self.total_units
+        elif key in ('tariff_type', 'tariff_rates', 'tariff_limits') and self.tariff_type is not None:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __repr__(self) -> str:
+        return f"Breakdown({self.as_dict()!r})"
+
+def _tier_values(tier_units, rates: tuple, rounded: bool = False) -> tuple:
+    """Per-tier units and costs plus subtotal and VAT, optionally rounded to 2 dp"""
+    tier_costs = [units * rate for units, rate in zip(tier_units, rates)]
+    subtotal = sum(tier_costs)
+    vat_amount = subtotal * VAT
+    if rounded:
+        return (tuple([round(units, 2) for units in tier_units]), tuple([round(cost, 2) for cost in tier_costs]),
+                round(subtotal, 2), round(vat_amount, 2))
+    return tuple(tier_units), tuple(tier_costs), subtotal, vat_amount
+
+def _payment_breakdown(tier_units: list, schedule: TariffSchedule, amount: float, units: float) -> Breakdown:
+    """Rounded breakdown of what a single payment buys"""
+    return Breakdown(*_tier_values(tier_units, schedule.rates, True), round(amount, 2), round(units, 2), schedule)
+
+def _empty_breakdown(schedule: TariffSchedule) -> Breakdown:
+    """Breakdown for a zero payment"""
+    zeros = (0,) * schedule.tiers
+    return Breakdown(zeros, zeros, 0, 0, 0, None, schedule)
+
+def _amount_breakdown(units: float, schedule: TariffSchedule) -> tuple:
+    """Tier units, tier costs, subtotal and VAT before rounding for a number of units"""
+    return _tier_values(schedule.tier_units(units), schedule.rates)
+
+def _payment_tiers(amount: float, tariff_type: str, schedule: TariffSchedule) -> list:
+    """Tier split of what a VAT-inclusive payment buys"""
+    row = _table_row('units', tariff_type, schedule, amount)
+    return row if row is not None else schedule.tier_units_for_subtotal(amount / (1 + VAT))
+
+def calculateAmountFromUnits(units: float, tariff_type: str = 'new') -> tuple[float, Breakdown]:
+    """Calculate amount and return detailed breakdown"""
+    if units < 0:
+        raise ValueError("Units cannot be negative")
+    
+    schedule = get_schedule(tariff_type)
+    
+    row = _table_row('cost', tariff_type, schedule, units)
+    if row is not None:
+        tiers = schedule.tiers
+        tier_units, tier_costs = tuple(row[:tiers]), tuple(row[tiers:2 * tiers])
+        subtotal, vat_amount, total = row[2 * tiers:]
+    else:
+        tier_units, tier_costs, subtotal, vat_amount = _amount_breakdown(units, schedule)
+        total = round(subtotal + vat_amount, 2)
+    
+    return total, Breakdown(tier_units, tier_costs, subtotal, vat_amount, total, units, schedule, tariff_type)
+
+def calculateUnitsFromAmount(amount: float, initial_amount: float = 0, tariff_type: str = 'new') -> tuple[float, Breakdown]:
+    """Calculate units and return detailed breakdown"""
+    if amount < 0:
+        raise ValueError("Amount cannot be negative")
+    if initial_amount < 0:
+        raise ValueError("Initial amount cannot be negative")
+    
+    schedule = get_schedule(tariff_type)
+    total_available = amount + initial_amount
+    
+    # Split the initial payment and the combined total across tiers in one pass each;
+    # the new payment buys exactly the difference, so nothing is rounded until the end
+    initial_tiers = _payment_tiers(initial_amount, tariff_type, schedule)
+    total_tiers = _payment_tiers(total_available, tariff_type, schedule)
+    new_tiers = [total - initial for total, initial in zip(total_tiers, initial_tiers)]
+    initial_units = sum(initial_tiers)
+    total_units = sum(total_tiers)
+    
+    initial_breakdown = _payment_breakdown(initial_tiers, schedule, initial_amount, initial_units) if initial_amount > 0 else None
+    new_breakdown = _payment_breakdown(new_tiers, schedule, amount, total_units - initial_units) if amount > 0 else None
+    
+    breakdown = Breakdown(
+        *_tier_values(total_tiers, schedule.rates, True), round(total_available, 2), round(total_units, 2),
+        schedule, tariff_type, initial_amount, amount, initial_breakdown, new_breakdown
+    )
+    
+    return round(total_units, 2), breakdown
+
+def calculateAmountFromUnits_reverse(amount: float, tariff_type: str = 'new') -> tuple[float, Breakdown]:
+    """Helper function to calculate units from amount (reverse of calculateAmountFromUnits)"""
+    schedule = get_schedule(tariff_type)
+    if amount <= 0:
+        return 0, _empty_breakdown(schedule)
+    
+    # Remove VAT first to get subtotal
+    subtotal = amount / (1 + VAT)
+    units = schedule.units_for_subtotal(subtotal)
+    
+    return round(units, 2), _payment_breakdown(schedule.tier_units_for_subtotal(subtotal), schedule, amount, units)
+
+def calculateAmountFromUnits_withOffset(amount: float, existing_units: float, tariff_type: str = 'new') -> tuple[float, Breakdown]:
+    """Calculate what new amount can buy considering existing tier usage"""
+    schedule = get_schedule(tariff_type)
+    if amount <= 0:
+        return 0, _empty_breakdown(schedule)
+    
+    # Remove VAT first to get subtotal
+    remaining_subtotal = amount / (1 + VAT)
+    
+    # Start filling from the tier the existing units end in
+    new_tiers = [0] * schedule.tiers
+    tier = bisect_right(schedule.limits, existing_units)
+    used = max(existing_units, schedule.tier_starts[tier])
+    while remaining_subtotal > 0:
+        rate = schedule.rates[tier]
+        if tier == schedule.tiers - 1:
+            new_tiers[tier] = remaining_subtotal / rate
+            break
+        new_tiers[tier] = min(schedule.limits[tier] - used, remaining_subtotal / rate)
+        remaining_subtotal -= new_tiers[tier] * rate
+        tier += 1
+        used = schedule.tier_starts[tier]
+    
+    new_units = sum(new_tiers)
+    
+    return round(new_units, 2), _payment_breakdown(new_tiers, schedule, amount, new_units)
+
+def _div_half_up(numerator, denominator: int):
+    """Non-negative integer division rounding halves up; works on ints and integer arrays"""
+    return (numerator + denominator // 2) // denominator
+
+def fixed_charges(milli):
+    """Subtotal and VAT in centimes for a cost in milli-RWF
+
+    This is the single rounding rule of the fixed-point mode: the exact milli-RWF
+    cost is rounded half up to centimes, then VAT is rounded half up on that subtotal.
+    Works on ints and integer arrays alike, so scalar and batch results agree exactly.
+    """
+    subtotal = _div_half_up(milli, 1000 // CENTIMES_PER_RWF)
+    return subtotal, _div_half_up(subtotal * VAT_PERCENT, 100)
+
+def fixed_subtotal_for_payment(centimes):
+    """Largest subtotal in centimes whose VAT-inclusive total does not exceed the payment"""
+    return centimes * 100 // (100 + VAT_PERCENT)
+
+def _fixed_breakdown(tier_wh: list, schedule: TariffSchedule) -> dict:
+    """Per-tier Wh and centimes plus subtotal and VAT for the fixed-point mode"""
+    tier_milli = [wh * int(rate) for wh, rate in zip(tier_wh, schedule.rates)]
+    subtotal, vat_amount = fixed_charges(sum(tier_milli))
+    breakdown = {}
+    for i, wh in enumerate(tier_wh, 1):
+        breakdown[f'tier{i}_wh'] = wh
+    for i, milli in enumerate(tier_milli, 1):
+        breakdown[f'tier{i}_cost'] = fixed_charges(milli)[0]
+    breakdown['subtotal'] = subtotal
+    breakdown['vat_amount'] = vat_amount
+    return breakdown
+
+def _check_fixed(value, name: str):
+    if not isinstance(value, int):
+        raise TypeError(f"{name} must be an integer in fixed-point mode")
+    if value < 0:
+        raise ValueError(f"{name} cannot be negative")
+
+def calculateAmountFromUnits_fixed(wh: int, tariff_type: str = 'new') -> tuple[int, dict]:
+    """Integer version of calculateAmountFromUnits: Wh in, centimes out"""
+    _check_fixed(wh, "Energy (Wh)")
+    schedule = get_schedule(tariff_type)
+    
+    breakdown = _fixed_breakdown(schedule.tier_wh(wh), schedule)
+    total = breakdown['subtotal'] + breakdown['vat_amount']
+    breakdown.update({
+        'total': total,
+        'total_wh': wh,
+        'tariff_type': tariff_type
+    })
+    
+    return total, breakdown
+
+def calculateUnitsFromAmount_fixed(amount: int, initial_amount: int = 0, tariff_type: str = 'new') -> tuple[int, dict]:
+    """Integer version of calculateUnitsFromAmount: centimes in, whole Wh out (rounded down)"""
+    _check_fixed(amount, "Amount (centimes)")
+    _check_fixed(initial_amount, "Initial amount (centimes)")
+    schedule = get_schedule(tariff_type)
+    total_available = amount + initial_amount
+    
+    # Same single pass as the float engine: the new payment buys the difference
+    initial_tiers = schedule.tier_wh_for_milli(fixed_subtotal_for_payment(initial_amount) * 10)
+    total_tiers = schedule.tier_wh_for_milli(fixed_subtotal_for_payment(total_available) * 10)
+    total_wh = sum(total_tiers)
+    
+    breakdown = _fixed_breakdown(total_tiers, schedule)
+    breakdown.update({
+        'total': total_available,
+        'initial_amount': initial_amount,
+        'new_amount': amount,
+        'total_wh': total_wh,
+        'initial_wh': sum(initial_tiers),
+        'new_wh': total_wh - sum(initial_tiers),
+        'tariff_type': tariff_type
+    })
+    
+    return total_wh, breakdown
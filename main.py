@@ -1,937 +1,534 @@
 from fasthtml.common import *
-from starlette.staticfiles import StaticFiles
-
-# Constants
-VAT = 0.18
-
-# Tariff structures
-OLD_TARIFFS = {
-    'rates': (89, 212, 249),
-    'limits': (15, 50),
-    'description': '2020-2025 Tariffs'
-}
-
-NEW_TARIFFS = {
-    'rates': (89, 310, 369),
-    'limits': (20, 50),
-    'description': 'October 2025 Tariffs'
-}
-
-# Default to new tariffs
-CURRENT_TARIFFS = NEW_TARIFFS
-TIER_1, TIER_2, TIER_3 = CURRENT_TARIFFS['rates']
-TIER_1_LIMIT, TIER_2_LIMIT = CURRENT_TARIFFS['limits']
-
-def calculateAmountFromUnits(units: float, tariff_type: str = 'new') -> tuple[float, dict]:
-    """Calculate amount and return detailed breakdown"""
-    if units < 0:
-        raise ValueError("Units cannot be negative")
-    
-    # Select tariff structure
-    tariffs = NEW_TARIFFS if tariff_type == 'new' else OLD_TARIFFS
-    t1_rate, t2_rate, t3_rate = tariffs['rates']
-    t1_limit, t2_limit = tariffs['limits']
-    
-    # Calculate tier usage
-    t1 = units if units <= t1_limit else t1_limit
-    t2 = 0 if units <= t1_limit else min(units - t1_limit, t2_limit - t1_limit)
-    t3 = 0 if units <= t2_limit else units - t2_limit
-    
-    # Calculate costs before VAT
-    t1_cost = t1 * t1_rate
-    t2_cost = t2 * t2_rate
-    t3_cost = t3 * t3_rate
-    subtotal = t1_cost + t2_cost + t3_cost
-    vat_amount = subtotal * VAT
-    total = subtotal + vat_amount
-    
-    breakdown = {
-        'tier1_units': t1,
-        'tier2_units': t2,
-        'tier3_units': t3,
-        'tier1_cost': t1_cost,
-        'tier2_cost': t2_cost,
-        'tier3_cost': t3_cost,
-        'subtotal': subtotal,
-        'vat_amount': vat_amount,
-        'total': round(total, 2),
-        'total_units': units,
-        'tariff_type': tariff_type,
-        'tariff_rates': tariffs['rates'],
-        'tariff_limits': tariffs['limits']
-    }
-    
-    return round(total, 2), breakdown
-
-def calculateUnitsFromAmount(amount: float, initial_amount: float = 0, tariff_type: str = 'new') -> tuple[float, dict]:
-    """Calculate units and return detailed breakdown"""
-    if amount < 0:
-        raise ValueError("Amount cannot be negative")
-    if initial_amount < 0:
-        raise ValueError("Initial amount cannot be negative")
-    
-    # Calculate breakdown for initial payment if it exists
-    initial_breakdown = None
-    initial_units = 0
-    if initial_amount > 0:
-        initial_units, initial_breakdown = calculateAmountFromUnits_reverse(initial_amount, tariff_type)
-    
-    # Calculate what new payment can buy, considering existing tier usage
-    new_breakdown = None
-    new_units = 0
-    if amount > 0:
-        new_units, new_breakdown = calculateAmountFromUnits_withOffset(amount, initial_units, tariff_type)
-    
-    # Calculate total
-    total_units = initial_units + new_units
-    total_available = amount + initial_amount
-    
-    # Calculate combined tier usage for total breakdown
-    total_result, total_breakdown = calculateAmountFromUnits_reverse(total_available, tariff_type)
-    
-    breakdown = {
-        'tier1_units': total_breakdown['tier1_units'],
-        'tier2_units': total_breakdown['tier2_units'],
-        'tier3_units': total_breakdown['tier3_units'],
-        'tier1_cost': total_breakdown['tier1_cost'],
-        'tier2_cost': total_breakdown['tier2_cost'],
-        'tier3_cost': total_breakdown['tier3_cost'],
-        'subtotal': total_breakdown['subtotal'],
-        'vat_amount': total_breakdown['vat_amount'],
-        'total': round(total_available, 2),
-        'initial_amount': initial_amount,
-        'new_amount': amount,
-        'total_units': round(total_units, 2),
-        'initial_breakdown': initial_breakdown,
-        'new_breakdown': new_breakdown,
-        'has_both_payments': initial_amount > 0 and amount > 0,
-        'tariff_type': tariff_type,
-        'tariff_rates': NEW_TARIFFS['rates'] if tariff_type == 'new' else OLD_TARIFFS['rates'],
-        'tariff_limits': NEW_TARIFFS['limits'] if tariff_type == 'new' else OLD_TARIFFS['limits']
-    }
-    
-    return round(total_units, 2), breakdown
+from starlette.routing import Route, WebSocketRoute
+import asyncio
+import bisect
+import contextlib
+import functools
+import hashlib
+import json
+import math
+import mmap
+import os
+import threading
+import time
+from array import array
 
-def calculateAmountFromUnits_reverse(amount: float, tariff_type: str = 'new') -> tuple[float, dict]:
-    """Helper function to calculate units from amount (reverse of calculateAmountFromUnits)"""
-    if amount <= 0:
-        return 0, {'tier1_units': 0, 'tier2_units': 0, 'tier3_units': 0, 'tier1_cost': 0, 'tier2_cost': 0, 'tier3_cost': 0, 'subtotal': 0, 'vat_amount': 0, 'total': 0}
-    
-    # Select tariff structure
-    tariffs = NEW_TARIFFS if tariff_type == 'new' else OLD_TARIFFS
-    t1_rate, t2_rate, t3_rate = tariffs['rates']
-    t1_limit, t2_limit = tariffs['limits']
-    
-    # Remove VAT first to get subtotal
-    subtotal = amount / (1 + VAT)
-    
-    TIER_1_COST_LIMIT = t1_limit * t1_rate
-    TIER_2_COST_LIMIT = TIER_1_COST_LIMIT + (t2_limit - t1_limit) * t2_rate
-    
-    if subtotal <= TIER_1_COST_LIMIT:
-        # Only tier 1
-        units = subtotal / t1_rate
-        t1, t2, t3 = units, 0, 0
-    elif subtotal <= TIER_2_COST_LIMIT:
-        # Tier 1 + some tier 2
-        t1 = t1_limit
-        t2 = (subtotal - TIER_1_COST_LIMIT) / t2_rate
-        t3 = 0
-        units = t1 + t2
-    else:
-        # All tiers
-        t1 = t1_limit
-        t2 = t2_limit - t1_limit
-        t3 = (subtotal - TIER_2_COST_LIMIT) / t3_rate
-        units = t1 + t2 + t3
-    
-    # Calculate breakdown
-    t1_cost = t1 * t1_rate
-    t2_cost = t2 * t2_rate
-    t3_cost = t3 * t3_rate
-    calc_subtotal = t1_cost + t2_cost + t3_cost
-    vat_amount = calc_subtotal * VAT
-    
-    breakdown = {
-        'tier1_units': round(t1, 2),
-        'tier2_units': round(t2, 2),
-        'tier3_units': round(t3, 2),
-        'tier1_cost': round(t1_cost, 2),
-        'tier2_cost': round(t2_cost, 2),
-        'tier3_cost': round(t3_cost, 2),
-        'subtotal': round(calc_subtotal, 2),
-        'vat_amount': round(vat_amount, 2),
-        'total': round(amount, 2),
-        'total_units': round(units, 2)
-    }
-    
-    return round(units, 2), breakdown
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
-def calculateAmountFromUnits_withOffset(amount: float, existing_units: float, tariff_type: str = 'new') -> tuple[float, dict]:
-    """Calculate what new amount can buy considering existing tier usage"""
-    if amount <= 0:
-        return 0, {'tier1_units': 0, 'tier2_units': 0, 'tier3_units': 0, 'tier1_cost': 0, 'tier2_cost': 0, 'tier3_cost': 0, 'subtotal': 0, 'vat_amount': 0, 'total': 0}
-    
-    # Select tariff structure
-    tariffs = NEW_TARIFFS if tariff_type == 'new' else OLD_TARIFFS
-    t1_rate, t2_rate, t3_rate = tariffs['rates']
-    t1_limit, t2_limit = tariffs['limits']
-    
-    # Remove VAT first to get subtotal
-    subtotal = amount / (1 + VAT)
-    
-    # Determine where we start based on existing units
-    remaining_t1 = max(0, t1_limit - existing_units)
-    remaining_t2 = max(0, t2_limit - existing_units) if existing_units < t2_limit else 0
-    
-    t1_new = t2_new = t3_new = 0
-    remaining_subtotal = subtotal
-    
-    # Fill tier 1 first if there's remaining capacity
-    if remaining_t1 > 0 and remaining_subtotal > 0:
-        t1_cost_available = remaining_subtotal
-        t1_units_affordable = t1_cost_available / t1_rate
-        t1_new = min(remaining_t1, t1_units_affordable)
-        remaining_subtotal -= t1_new * t1_rate
-    
-    # Fill tier 2 if there's remaining capacity and budget
-    if remaining_t2 > 0 and remaining_subtotal > 0:
-        t2_cost_available = remaining_subtotal
-        t2_units_affordable = t2_cost_available / t2_rate
-        t2_new = min(remaining_t2, t2_units_affordable)
-        remaining_subtotal -= t2_new * t2_rate
-    
-    # Fill tier 3 with remaining budget
-    if remaining_subtotal > 0:
-        t3_new = remaining_subtotal / t3_rate
-    
-    new_units = t1_new + t2_new + t3_new
-    
-    # Calculate breakdown
-    t1_cost = t1_new * t1_rate
-    t2_cost = t2_new * t2_rate
-    t3_cost = t3_new * t3_rate
-    calc_subtotal = t1_cost + t2_cost + t3_cost
-    vat_amount = calc_subtotal * VAT
-    
-    breakdown = {
-        'tier1_units': round(t1_new, 2),
-        'tier2_units': round(t2_new, 2),
-        'tier3_units': round(t3_new, 2),
-        'tier1_cost': round(t1_cost, 2),
-        'tier2_cost': round(t2_cost, 2),
-        'tier3_cost': round(t3_cost, 2),
-        'subtotal': round(calc_subtotal, 2),
-        'vat_amount': round(vat_amount, 2),
-        'total': round(amount, 2),
-        'total_units': round(new_units, 2)
-    }
-    
-    return round(new_units, 2), breakdown
+from engine import *
+from views import *
+from views import _request_events, _stage_timings
 
-# FastHTML app setup with default Pico CSS
-app, rt = fast_app(pico=True, tailwind=False)
+# The calculator page and live fragments come from views.py; this module adds the
+# instrumentation, the /live channel and the JSON API
+app = calculator_app()
+rt = app.route
 
-def create_breakdown_table(breakdown: dict, is_from_units: bool = True):
-    """Create a detailed breakdown table"""
-    
-    # If we have both payments, show separate breakdowns
-    if breakdown.get('has_both_payments', False):
-        return create_dual_breakdown_table(breakdown)
-    
-    # Get tariff info
-    tariff_rates = breakdown.get('tariff_rates', NEW_TARIFFS['rates'])
-    tariff_limits = breakdown.get('tariff_limits', NEW_TARIFFS['limits'])
-    t1_rate, t2_rate, t3_rate = tariff_rates
-    t1_limit, t2_limit = tariff_limits
-    
-    table_content = [
-        Article(
-            H4("Tier Breakdown"),
-            Table(
-                Thead(
-                    Tr(
-                        Th("Tier"),
-                        Th("Rate (RWF/kWh)"),
-                        Th("Units Used"),
-                        Th("Cost (RWF)")
-                    )
-                ),
-                Tbody(
-                    Tr(
-                        Td(f"Tier 1 (0-{t1_limit} kWh)"),
-                        Td(f"{t1_rate}"),
-                        Td(f"{breakdown['tier1_units']:.2f}"),
-                        Td(f"{breakdown['tier1_cost']:.2f}")
-                    ) if breakdown['tier1_units'] > 0 else None,
-                    Tr(
-                        Td(f"Tier 2 ({t1_limit}-{t2_limit} kWh)"),
-                        Td(f"{t2_rate}"),
-                        Td(f"{breakdown['tier2_units']:.2f}"),
-                        Td(f"{breakdown['tier2_cost']:.2f}")
-                    ) if breakdown['tier2_units'] > 0 else None,
-                    Tr(
-                        Td(f"Tier 3 ({t2_limit}+ kWh)"),
-                        Td(f"{t3_rate}"),
-                        Td(f"{breakdown['tier3_units']:.2f}"),
-                        Td(f"{breakdown['tier3_cost']:.2f}")
-                    ) if breakdown['tier3_units'] > 0 else None,
-                    Tr(
-                        Td(Strong("Subtotal (Units)")),
-                        Td(""),
-                        Td(Strong(f"{breakdown['total_units']:.2f} kWh")),
-                        Td("")
-                    ),
-                    Tr(
-                        Td(Strong("Subtotal (Cost)")),
-                        Td(""),
-                        Td(""),
-                        Td(Strong(f"{breakdown['subtotal']:.2f}"))
-                    ),
-                    Tr(
-                        Td(f"VAT ({VAT*100}%)"),
-                        Td(""),
-                        Td(""),
-                        Td(f"{breakdown['vat_amount']:.2f}")
-                    ),
-                    Tr(
-                        Td(Strong("Total")),
-                        Td(""),
-                        Td(""),
-                        Td(Strong(f"{breakdown['total']:.2f}"))
-                    )
-                )
-            )
-        )
-    ]
-    
-    # Add payment breakdown if applicable (for units from amount with initial payment)
-    if 'initial_amount' in breakdown and breakdown['initial_amount'] > 0 and not breakdown.get('has_both_payments', False):
-        table_content.append(
-            Article(
-                H4("Payment Summary"),
-                Table(
-                    Tbody(
-                        Tr(
-                            Td("Initial Payment:"),
-                            Td(f"{breakdown['initial_amount']:.2f} RWF")
-                        ),
-                        Tr(
-                            Td("New Payment:"),
-                            Td(f"{breakdown['new_amount']:.2f} RWF")
-                        ),
-                        Tr(
-                            Td(Strong("Total Available:")),
-                            Td(Strong(f"{breakdown['total']:.2f} RWF"))
-                        )
-                    )
-                )
-            )
-        )
-    
-    return Div(*table_content)
+# Server-Timing instrumentation, enabled with SERVER_TIMING=1. Handlers wrap their stages in
+# `with stage('parse' | 'calc' | 'render'):`; with the middleware off that is a no-op.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '0') == '1'
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
 
-def create_dual_breakdown_table(breakdown: dict):
-    """Create separate breakdown tables for initial and new payments"""
-    tables = []
-    
-    # Get tariff info
-    tariff_rates = breakdown.get('tariff_rates', NEW_TARIFFS['rates'])
-    tariff_limits = breakdown.get('tariff_limits', NEW_TARIFFS['limits'])
-    t1_rate, t2_rate, t3_rate = tariff_rates
-    t1_limit, t2_limit = tariff_limits
-    
-    # Payment Summary first
-    tables.append(
-        Article(
-            H4("Payment Summary"),
-            Table(
-                Tbody(
-                    Tr(
-                        Td("Initial Payment:"),
-                        Td(f"{breakdown['initial_amount']:.2f} RWF"),
-                        Td(f"→ {breakdown['initial_breakdown']['total_units']:.2f} kWh")
-                    ),
-                    Tr(
-                        Td("New Payment:"),
-                        Td(f"{breakdown['new_amount']:.2f} RWF"),
-                        Td(f"→ {breakdown['new_breakdown']['total_units']:.2f} kWh")
-                    ),
-                    Tr(
-                        Td(Strong("Total:")),
-                        Td(Strong(f"{breakdown['total']:.2f} RWF")),
-                        Td(Strong(f"→ {breakdown['total_units']:.2f} kWh"))
-                    )
-                )
-            )
-        )
-    )
-    
-    # New Payment Breakdown (moved up)
-    if breakdown['new_breakdown'] and breakdown['new_amount'] > 0:
-        new = breakdown['new_breakdown']
-        tables.append(
-            Article(
-                H4("New Payment Tier Breakdown"),
-                Table(
-                    Thead(
-                        Tr(
-                            Th("Tier"),
-                            Th("Rate (RWF/kWh)"),
-                            Th("Units Added"),
-                            Th("Cost (RWF)")
-                        )
-                    ),
-                    Tbody(
-                        Tr(
-                            Td(f"Tier 1 (0-{t1_limit} kWh)"),
-                            Td(f"{t1_rate}"),
-                            Td(f"{new['tier1_units']:.2f}"),
-                            Td(f"{new['tier1_cost']:.2f}")
-                        ) if new['tier1_units'] > 0 else None,
-                        Tr(
-                            Td(f"Tier 2 ({t1_limit}-{t2_limit} kWh)"),
-                            Td(f"{t2_rate}"),
-                            Td(f"{new['tier2_units']:.2f}"),
-                            Td(f"{new['tier2_cost']:.2f}")
-                        ) if new['tier2_units'] > 0 else None,
-                        Tr(
-                            Td(f"Tier 3 ({t2_limit}+ kWh)"),
-                            Td(f"{t3_rate}"),
-                            Td(f"{new['tier3_units']:.2f}"),
-                            Td(f"{new['tier3_cost']:.2f}")
-                        ) if new['tier3_units'] > 0 else None,
-                        Tr(
-                            Td(Strong("Subtotal (Units)")),
-                            Td(""),
-                            Td(Strong(f"{new['total_units']:.2f} kWh")),
-                            Td("")
-                        ),
-                        Tr(
-                            Td(Strong("Subtotal (Cost)")),
-                            Td(""),
-                            Td(""),
-                            Td(Strong(f"{new['subtotal']:.2f}"))
-                        ),
-                        Tr(
-                            Td(f"VAT ({VAT*100}%)"),
-                            Td(""),
-                            Td(""),
-                            Td(f"{new['vat_amount']:.2f}")
-                        ),
-                        Tr(
-                            Td(Strong("Total")),
-                            Td(""),
-                            Td(""),
-                            Td(Strong(f"{new['total']:.2f}"))
-                        )
-                    )
-                )
-            )
-        )
-    
-    # Initial Payment Breakdown
-    if breakdown['initial_breakdown'] and breakdown['initial_amount'] > 0:
-        initial = breakdown['initial_breakdown']
-        tables.append(
-            Article(
-                H4("Initial Payment Tier Breakdown"),
-                Table(
-                    Thead(
-                        Tr(
-                            Th("Tier"),
-                            Th("Rate (RWF/kWh)"),
-                            Th("Units Used"),
-                            Th("Cost (RWF)")
-                        )
-                    ),
-                    Tbody(
-                        Tr(
-                            Td(f"Tier 1 (0-{t1_limit} kWh)"),
-                            Td(f"{t1_rate}"),
-                            Td(f"{initial['tier1_units']:.2f}"),
-                            Td(f"{initial['tier1_cost']:.2f}")
-                        ) if initial['tier1_units'] > 0 else None,
-                        Tr(
-                            Td(f"Tier 2 ({t1_limit}-{t2_limit} kWh)"),
-                            Td(f"{t2_rate}"),
-                            Td(f"{initial['tier2_units']:.2f}"),
-                            Td(f"{initial['tier2_cost']:.2f}")
-                        ) if initial['tier2_units'] > 0 else None,
-                        Tr(
-                            Td(f"Tier 3 ({t2_limit}+ kWh)"),
-                            Td(f"{t3_rate}"),
-                            Td(f"{initial['tier3_units']:.2f}"),
-                            Td(f"{initial['tier3_cost']:.2f}")
-                        ) if initial['tier3_units'] > 0 else None,
-                        Tr(
-                            Td(Strong("Subtotal (Units)")),
-                            Td(""),
-                            Td(Strong(f"{initial['total_units']:.2f} kWh")),
-                            Td("")
-                        ),
-                        Tr(
-                            Td(Strong("Subtotal (Cost)")),
-                            Td(""),
-                            Td(""),
-                            Td(Strong(f"{initial['subtotal']:.2f}"))
-                        ),
-                        Tr(
-                            Td(f"VAT ({VAT*100}%)"),
-                            Td(""),
-                            Td(""),
-                            Td(f"{initial['vat_amount']:.2f}")
-                        ),
-                        Tr(
-                            Td(Strong("Total")),
-                            Td(""),
-                            Td(""),
-                            Td(Strong(f"{initial['total']:.2f}"))
-                        )
-                    )
-                )
-            )
-        )
-    
-    # Combined Total Breakdown
-    tables.append(
-        Article(
-            H4("Combined Total Breakdown"),
-            Table(
-                Thead(
-                    Tr(
-                        Th("Tier"),
-                        Th("Rate (RWF/kWh)"),
-                        Th("Total Units"),
-                        Th("Total Cost (RWF)")
-                    )
-                ),
-                Tbody(
-                    Tr(
-                        Td(f"Tier 1 (0-{t1_limit} kWh)"),
-                        Td(f"{t1_rate}"),
-                        Td(f"{breakdown['tier1_units']:.2f}"),
-                        Td(f"{breakdown['tier1_cost']:.2f}")
-                    ) if breakdown['tier1_units'] > 0 else None,
-                    Tr(
-                        Td(f"Tier 2 ({t1_limit}-{t2_limit} kWh)"),
-                        Td(f"{t2_rate}"),
-                        Td(f"{breakdown['tier2_units']:.2f}"),
-                        Td(f"{breakdown['tier2_cost']:.2f}")
-                    ) if breakdown['tier2_units'] > 0 else None,
-                    Tr(
-                        Td(f"Tier 3 ({t2_limit}+ kWh)"),
-                        Td(f"{t3_rate}"),
-                        Td(f"{breakdown['tier3_units']:.2f}"),
-                        Td(f"{breakdown['tier3_cost']:.2f}")
-                    ) if breakdown['tier3_units'] > 0 else None,
-                    Tr(
-                        Td(Strong("Grand Total (Units)")),
-                        Td(""),
-                        Td(Strong(f"{breakdown['total_units']:.2f} kWh")),
-                        Td("")
-                    ),
-                    Tr(
-                        Td(Strong("Grand Total (Cost)")),
-                        Td(""),
-                        Td(""),
-                        Td(Strong(f"{breakdown['subtotal']:.2f}"))
-                    ),
-                    Tr(
-                        Td(f"VAT ({VAT*100}%)"),
-                        Td(""),
-                        Td(""),
-                        Td(f"{breakdown['vat_amount']:.2f}")
-                    ),
-                    Tr(
-                        Td(Strong("Final Total")),
-                        Td(""),
-                        Td(""),
-                        Td(Strong(f"{breakdown['total']:.2f}"))
-                    )
-                )
-            )
-        )
-    )
-    
-    return Div(*tables)
+class LatencyHistogram:
+    """Fixed-bucket histogram of durations in seconds (buckets are upper bounds, plus +Inf)"""
+    __slots__ = ('counts', 'count', 'sum')
 
-@rt('/')
-def get():
-    return Title('Rwanda Electricity Calculator'),Head(
-            # Favicon links for various devices/browsers
-            Link(rel="icon", href="/static/favicon.ico", type="image/x-icon"),  # Default ICO
-            Link(rel="icon", type="image/png", sizes="16x16", href="/static/favicon-16x16.png"),
-            Link(rel="icon", type="image/png", sizes="32x32", href="/static/favicon-32x32.png"),
-            Link(rel="apple-touch-icon", sizes="180x180", href="/static/apple-touch-icon.png"),  # iOS Safari
-            Link(rel="icon", type="image/png", sizes="192x192", href="/static/android-chrome-192x192.png"),  # Android Chrome
-            Link(rel="icon", type="image/png", sizes="512x512", href="/static/android-chrome-512x512.png"),  # Android Chrome (high-res)
-            Link(rel="manifest", href="/static/site.webmanifest"),  # Web App Manifest for PWA
-        ),Main(
-        Header(
-            H1('Rwanda Energy Group Calculator'),
-            P('Calculate electricity costs and units with detailed tier breakdown'),
-            P(A('View Official REG Tariffs', href='https://www.reg.rw/customer-service/tariffs/', target='_blank')),
-            P(A('See this announcement for new tariffs', href='https://rdjarbeng.com/rura-announces-revised-electricity-end-user-tariffs-effective-october-2025/', target='_blank')),
-            
-            # Tariff Toggle - FIXED
-            Article(
-                H4("Tariff Selection"),
-                Div(
-                    Label(
-                        Input(
-                            type='radio', 
-                            name='tariff_type',  # Changed from 'tariff-type'
-                            value='new',
-                            checked=True,
-                            hx_get='/update-tariff',
-                            hx_trigger='change',
-                            hx_target='#units-result, #cost-result',
-                            hx_include='#amount-input, #initial-amount-input, #units-input, input[name="tariff_type"]:checked'
-                        ),
-                        f" {NEW_TARIFFS['description']} (Current)"
-                    ),
-                    Label(
-                        Input(
-                            type='radio', 
-                            name='tariff_type',  # Changed from 'tariff-type'
-                            value='old',
-                            hx_get='/update-tariff',
-                            hx_trigger='change',
-                            hx_target='#units-result, #cost-result',
-                            hx_include='#amount-input, #initial-amount-input, #units-input, input[name="tariff_type"]:checked'
-                        ),
-                        f" {OLD_TARIFFS['description']}"
-                    ),
-                    style='display: flex; gap: 2rem; margin-top: 0.5rem;'
-                ),
-                Small("Switch between old and new tariff structures to compare prices"),
-                cls='tariff-selector'
-            )
-        ),
-        
-        Div(
-            Div(
-                Section(
-                    H2('Calculate Units from Cost'),
-                    Form(
-                        Div(
-                            Label('Enter amount (RWF):', For='amount-input'),
-                            Input(
-                                type='number', 
-                                id='amount-input',
-                                name='amount', 
-                                placeholder='0.00', 
-                                min='0', 
-                                step='0.01',
-                                hx_get='/calculate-units-live',
-                                hx_trigger='input changed delay:300ms',
-                                hx_target='#units-result',
-                                hx_include='this, #initial-amount-input, input[name="tariff_type"]:checked',  # Updated
-                                style='max-width: 300px;'
-                            ),
-                            Small('Enter the amount you want to spend on electricity')
-                        ),
-                        Div(
-                            Label('Initial payment already made (optional):', For='initial-amount-input'),
-                            Input(
-                                type='number', 
-                                id='initial-amount-input',
-                                name='initial_amount', 
-                                placeholder='0.00', 
-                                min='0', 
-                                step='0.01',
-                                hx_get='/calculate-units-live',
-                                hx_trigger='input changed delay:300ms',
-                                hx_target='#units-result',
-                                hx_include='#amount-input, this, input[name="tariff_type"]:checked',  # Updated
-                                style='max-width: 300px;'
-                            ),
-                            Small('Enter any amount already paid at the beginning of the month')
-                        )
-                    ),
-                    
-                    Hr(),
-                    
-                    Section(
-                        H2('Calculate Cost from Units'),
-                        Form(
-                            Div(
-                                Label('Enter units (kWh):', For='units-input'),
-                                Input(
-                                    type='number', 
-                                    id='units-input',
-                                    name='units', 
-                                    placeholder='0.00', 
-                                    min='0', 
-                                    step='0.01',
-                                    hx_get='/calculate-cost-live',
-                                    hx_trigger='input changed delay:300ms',
-                                    hx_target='#cost-result',
-                                    hx_include='this, input[name="tariff_type"]:checked',  # Updated
-                                    style='max-width: 300px;'
-                                ),
-                                Small('Enter the number of kilowatt-hours (kWh) consumed')
-                            )
-                        )
-                    ),
-                    cls='input-section'
-                ),
-                
-                Div(
-                    Div(id='units-result', cls='result-container'),
-                    Div(id='cost-result', cls='result-container'),
-                    cls='results-section'
-                ),
-                cls='calculator-container'
-            ),
-            cls='main-container'
-        ),
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (inf when it is past the last bucket)"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (math.inf,), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return 0.0
+
+timing_histograms = {}  # (route, stage) -> LatencyHistogram
+_timing_lock = threading.Lock()
+
+def route_label(scope: dict) -> str:
+    """Route path for labelling timings; anything not matching a route path exactly is grouped"""
+    path = scope['path']
+    if path in _route_paths():
+        return path
+    return '/static' if path.startswith('/static/') else 'other'
+
+@functools.cache
+def _route_paths() -> frozenset:
+    return frozenset(route.path for route in app.routes if isinstance(route, Route) and not route.path.startswith('/static/'))
+
+def timing_stats() -> dict:
+    """Count, mean and approximate p50/p95/p99 in ms per route and stage"""
+    with _timing_lock:
+        histograms = {key: (h.count, h.sum, [h.quantile(q) for q in (0.5, 0.95, 0.99)]) for key, h in timing_histograms.items()}
+    return {
+        f'{route} {name}': {'count': count, 'mean_ms': round(total / count * 1000, 3),
+                            **{f'p{p}_ms': bound * 1000 for p, bound in zip((50, 95, 99), quantiles)}}
+        for (route, name), (count, total, quantiles) in sorted(histograms.items()) if count
+    }
+
+class ServerTimingMiddleware:
+    """Adds a Server-Timing header with the request's stages and records them in timing_histograms"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
         
+        timings = {}
+        token = _stage_timings.set(timings)
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                timings['total'] = time.perf_counter() - start
+                header = ', '.join(f'{name};dur={seconds * 1000:.3f}' for name, seconds in timings.items())
+                message['headers'] = list(message.get('headers', [])) + [(b'server-timing', header.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _stage_timings.reset(token)
+            timings['total'] = time.perf_counter() - start
+            route = route_label(scope)
+            with _timing_lock:
+                for name, seconds in timings.items():
+                    histogram = timing_histograms.get((route, name))
+                    if histogram is None:
+                        histogram = timing_histograms[route, name] = LatencyHistogram()
+                    histogram.observe(seconds)
+
+if SERVER_TIMING:
+    app.add_middleware(ServerTimingMiddleware)
+
+# Prometheus metrics. Every worker process keeps its counters in its own memory-mapped file
+# under METRICS_DIR (anonymous memory when unset), laid out identically in every worker, so
+# /metrics in any worker can sum all the files. Handlers only note events on the request;
+# MetricsMiddleware applies them on the event loop thread, the only writer, so no locks.
+METRICS = os.environ.get('METRICS', '1') != '0'
+METRICS_DIR = os.environ.get('METRICS_DIR')
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+
+class WorkerMetrics:
+    """This worker's counters as float64 slots in a memory-mapped file"""
+    MAGIC = b'RWMETRC1'
+    # Counters of workers that have exited, folded together by the supervisor
+    ARCHIVE = 'metrics-archive.bin'
+
+    def __init__(self, directory: str | None = METRICS_DIR):
+        self.directory = directory
+        self.pid = None
+        self._slots = None
+
+    def schema(self) -> list:
+        """(metric, labels) of every slot, in slot order; identical in every worker of a deployment"""
+        routes = sorted(_route_paths()) + ['/static', 'other']
+        series = [('calculator_http_requests_total', (('route', route), ('status', status)))
+                  for route in routes for status in STATUS_CLASSES]
+        for route in routes:
+            series += [('calculator_http_request_duration_seconds_bucket', (('route', route), ('le', repr(bound))))
+                       for bound in LATENCY_BUCKETS]
+            series += [('calculator_http_request_duration_seconds_bucket', (('route', route), ('le', '+Inf'))),
+                       ('calculator_http_request_duration_seconds_sum', (('route', route),)),
+                       ('calculator_http_request_duration_seconds_count', (('route', route),))]
+        series += [('calculator_http_response_bytes_total', (('route', route),)) for route in routes]
+        series += [('calculator_invalid_input_errors_total', (('route', route),)) for route in routes]
+        for tariff_type in sorted(TARIFF_SCHEDULES):
+            series += [('calculator_calculations_total', (('tariff_type', tariff_type), ('kind', kind))) for kind in ('cost', 'units')]
+        return series
+
+    def header(self, series: list) -> bytes:
+        """MAGIC and the fingerprint of the slot layout, at the start of every file"""
+        return self.MAGIC + hashlib.sha256(repr(series).encode()).digest()[:8]
+
+    def _open(self):
+        """Map this process's slots; called again after a fork so workers never share a file"""
+        self.series = self.schema()
+        self.slot = {key: i for i, key in enumerate(self.series)}
+        size = 16 + 8 * len(self.series)
+        if self.directory is None:
+            buffer = mmap.mmap(-1, size)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f'metrics-{os.getpid()}.bin'), 'w+b') as f:
+                f.truncate(size)
+                buffer = mmap.mmap(f.fileno(), size)
+        buffer[:16] = self.header(self.series)
+        self._slots = memoryview(buffer)[16:].cast('d')
+        self.pid = os.getpid()
+
+    def slots(self) -> memoryview:
+        if self.pid != os.getpid():
+            self._open()
+        return self._slots
+
+    def record(self, route: str, status: int, seconds: float, response_bytes: int, events: dict):
+        """Apply one finished request: its status, duration, bytes and noted events"""
+        slots = self.slots()
+        slot = self.slot
+        slots[slot['calculator_http_requests_total', (('route', route), ('status', f'{status // 100}xx'))]] += 1
+        bound = LATENCY_BUCKETS[i] if (i := bisect.bisect_left(LATENCY_BUCKETS, seconds)) < len(LATENCY_BUCKETS) else None
+        slots[slot['calculator_http_request_duration_seconds_bucket', (('route', route), ('le', '+Inf' if bound is None else repr(bound)))]] += 1
+        slots[slot['calculator_http_request_duration_seconds_sum', (('route', route),)]] += seconds
+        slots[slot['calculator_http_request_duration_seconds_count', (('route', route),)]] += 1
+        slots[slot['calculator_http_response_bytes_total', (('route', route),)]] += response_bytes
+        for key, count in events.items():
+            if key[0] == 'calculator_invalid_input_errors_total':
+                key = (key[0], (('route', route),))
+            index = slot.get(key)
+            if index is not None:
+                slots[index] += count
+
+    def totals(self) -> list:
+        """Slot values summed over every worker file with the same layout (just this worker without METRICS_DIR)"""
+        totals = self.slots().tolist()
+        if self.directory is None:
+            return totals
+        header = self.header(self.series)
+        with self._locked(shared=True):
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if name == f'metrics-{self.pid}.bin' or not (name.startswith('metrics-') and name.endswith('.bin')):
+                    continue
+                try:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                except OSError:
+                    continue
+                if data[:16] == header and len(data) == 16 + 8 * len(totals):
+                    totals = [a + b for a, b in zip(totals, memoryview(data)[16:].cast('d'))]
+        return totals
+
+    @contextlib.contextmanager
+    def _locked(self, shared: bool):
+        """Lock METRICS_DIR so a scrape never sees an exited worker's counters twice or not at all"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+
+    def retire(self, pid: int):
+        """Fold an exited worker's file into ARCHIVE and remove it (run by the supervisor after reaping it)
+
+        Scrapes then read one file per live worker plus the archive, and a later worker that
+        gets the same pid starts a fresh file without losing the old counts. Files of another
+        slot layout, left by workers of the code before a reload, are only removed.
+        """
+        if self.directory is None:
+            return
+        path = os.path.join(self.directory, f'metrics-{pid}.bin')
+        archive_path = os.path.join(self.directory, self.ARCHIVE)
+        header = self.header(self.schema())
+        with self._locked(shared=False):
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            if data[:16] == header:
+                try:
+                    with open(archive_path, 'rb') as f:
+                        archive = f.read()
+                except FileNotFoundError:
+                    archive = b''
+                if archive[:16] == header and len(archive) == len(data):
+                    values = array('d', memoryview(archive)[16:].cast('d'))
+                    for i, value in enumerate(memoryview(data)[16:].cast('d')):
+                        values[i] += value
+                    data = header + values.tobytes()
+                # Written aside and renamed into place, so a reader never sees half an archive
+                with open(archive_path + '.tmp', 'wb') as f:
+                    f.write(data)
+                os.replace(archive_path + '.tmp', archive_path)
+            os.unlink(path)
+
+    def exposition(self) -> str:
+        """All series in the Prometheus text format, histogram buckets made cumulative"""
+        totals = self.totals()
+        help_text = {
+            'calculator_http_requests_total': ('counter', "Requests handled, by route and status class"),
+            'calculator_http_request_duration_seconds': ('histogram', "Request latency in seconds, by route"),
+            'calculator_http_response_bytes_total': ('counter', "Response body bytes sent, by route"),
+            'calculator_invalid_input_errors_total': ('counter', "Requests or API items rejected as invalid input, by route"),
+            'calculator_calculations_total': ('counter', "Engine calculations, by tariff and kind"),
+        }
+        lines, family, cumulative = [], None, 0.0
+        for (name, labels), value in zip(self.series, totals):
+            base = name.removesuffix('_bucket').removesuffix('_sum').removesuffix('_count') if 'duration' in name else name
+            if base != family:
+                family = base
+                kind, text = help_text[base]
+                lines += [f'# HELP {base} {text}', f'# TYPE {base} {kind}']
+            if name.endswith('_bucket'):
+                cumulative = value + (cumulative if labels[1][1] != repr(LATENCY_BUCKETS[0]) else 0.0)
+                value = cumulative
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels)
+            lines.append(f'{name}{{{label_text}}} {value:.17g}')
+        return '\n'.join(lines) + '\n'
+
+worker_metrics = WorkerMetrics()
+
+class MetricsMiddleware:
+    """Counts requests, latency and response bytes per route into worker_metrics"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
         
-        Style("""
-            /* Tariff selector styling */
-            .tariff-selector {
-                background-color: var(--primary-background);
-                border: 1px solid var(--primary);
-                border-radius: var(--border-radius);
-                padding: 1rem;
-                margin-bottom: 1rem;
-            }
-            
-            .tariff-selector input[type="radio"] {
-                margin-right: 0.5rem;
-            }
-
-            .main-container {
-                max-width: 1200px;
-                margin: 0 auto;
-            }
-            
-            .calculator-container {
-                display: grid;
-                grid-template-columns: 1fr 1fr;
-                gap: 2rem;
-                align-items: start;
-            }
-            
-            .input-section {
-                background-color: var(--background-color);
-                padding: 1.5rem;
-                border-radius: var(--border-radius);
-                border: 1px solid var(--muted-border-color);
-            }
-            
-            .results-section {
-                display: flex;
-                flex-direction: column;
-                gap: 1rem;
-            }
-            
-            .result-container {
-                padding: 1rem;
-                background-color: var(--background-color);
-                border: 1px solid var(--muted-border-color);
-                border-radius: var(--border-radius);
-                min-height: 100px;
-            }
-            
-            .result-container:empty {
-                display: none;
-            }
-            
-            .highlight {
-                background-color: var(--primary-background);
-                padding: 0.75rem;
-                border-radius: var(--border-radius);
-                margin: 0.5rem 0;
-                font-size: 1.1em;
-                font-weight: bold;
-            }
-            
-            table {
-                margin-top: 1rem;
-                width: 100%;
-            }
-            
-            .error {
-                color: var(--del-color);
-                background-color: var(--del-background);
-                padding: 0.5rem;
-                border-radius: var(--border-radius);
-            }
-            
-            form > div {
-                margin-bottom: 1rem;
-            }
-            
-            /* Mobile responsiveness */
-            @media (max-width: 768px) {
-                .calculator-container {
-                    grid-template-columns: 1fr;
-                    gap: 1rem;
-                }
-                
-                .input-section {
-                    padding: 1rem;
-                }
-                
-                .main-container {
-                    padding: 0 1rem;
-                }
-            }
-            
-            /* Ensure tables look good */
-            table th, table td {
-                text-align: left;
-                padding: 0.5rem;
-            }
-            
-            table th:last-child, table td:last-child {
-                text-align: right;
-            }
-            
-            table th:nth-child(2), table td:nth-child(2) {
-                text-align: center;
-            }
-        """)
-    )
-
-@rt('/calculate-cost-live')
-def get(units: str = "", tariff_type: str = "new", **kwargs):
-    if not units or units == "":
-        return Div()
-    
+        events = {}
+        token = _request_events.set(events)
+        start = time.perf_counter()
+        status, sent = 500, 0
+
+        async def send_counting(message):
+            nonlocal status, sent
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            elif message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_counting)
+        finally:
+            _request_events.reset(token)
+            worker_metrics.record(route_label(scope), status, time.perf_counter() - start, sent, events)
+
+if METRICS:
+    app.add_middleware(MetricsMiddleware)
+
+# Each /live message carries the sending input's form and the tariff; results go back as
+# out-of-band swaps of #units-result and #cost-result. Only the latest message per result is
+# computed: any that arrive while a result is being computed replace the one waiting before it.
+LIVE_RESULTS = {'amount': ('units',), 'initial_amount': ('units',), 'units': ('cost',), 'tariff_type': ('units', 'cost')}
+
+def live_result(result: str, message: dict) -> str:
+    """Out-of-band swap with the units or cost result for the fields in message"""
+    items = [(name, str(value)) for name, value in message.items() if isinstance(value, (str, int, float))]
+    if result == 'units':
+        fragment = live_units(normalize_params('/live', items, UNITS_FIELDS), fragment_html)
+    else:
+        fragment = live_cost(normalize_params('/live', items, COST_FIELDS), fragment_html)
+    return to_xml(Div(fragment, id=f'{result}-result', hx_swap_oob='innerHTML'))
+
+async def live_socket(websocket: WebSocket):
+    await websocket.accept()
+    pending = {}
+    arrived = asyncio.Event()
+
+    async def receive():
+        while True:
+            received = await websocket.receive()
+            if received['type'] == 'websocket.disconnect':
+                return
+            # Binary frames carry no 'text'; the client only ever sends JSON text
+            if received.get('text') is None:
+                continue
+            try:
+                message = json.loads(received['text'])
+            except ValueError:
+                continue
+            if not isinstance(message, dict):
+                continue
+            headers = message.pop('HEADERS', None)
+            trigger = headers.get('HX-Trigger-Name') if isinstance(headers, dict) else None
+            if not isinstance(trigger, str):
+                continue
+            for result in LIVE_RESULTS.get(trigger, ()):
+                pending[result] = message
+            arrived.set()
+
+    reader = asyncio.create_task(receive())
     try:
-        units_val = float(units)
-        
-        if units_val == 0:
-            return Div()
-            
-        result, breakdown = calculateAmountFromUnits(units_val, tariff_type)
-        
-        tariff_desc = NEW_TARIFFS['description'] if tariff_type == 'new' else OLD_TARIFFS['description']
-        
-        return Div(
-            Div(
-                H3("Cost Calculation Result"),
-                P(f"{units_val} kWh = {result} RWF", cls='highlight'),
-                Small(f"Using {tariff_desc}", style='color: var(--muted-color);'),
-                cls='result-summary'
-            ),
-            create_breakdown_table(breakdown)
-        )
-    except (ValueError, TypeError) as e:
-        return Div(P(f"Invalid input: Please enter a valid number", cls='error'))
+        while not reader.done():
+            waiter = asyncio.ensure_future(arrived.wait())
+            await asyncio.wait((reader, waiter), return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            arrived.clear()
+            while pending:
+                result = next(iter(pending))
+                # Sending yields to the reader, which may replace what is still pending
+                await websocket.send_text(live_result(result, pending.pop(result)))
+    except WebSocketDisconnect:
+        return
+    finally:
+        reader.cancel()
+    reader.result()
+
+app.routes.append(WebSocketRoute('/live', live_socket))
+
+# JSON API for integrations; same engine, breakdown dicts instead of HTML
+API_MAX_BATCH = 10_000
+# Request size limits: a whole /api/v1/calculate body, and one /api/v1/calculate/stream line
+API_MAX_BODY = 4 * 1024 * 1024
+API_MAX_LINE = 16 * 1024
+
+class PayloadTooLarge(Exception):
+    """A request body or NDJSON line over its size limit"""
+
+def payload_too_large(message: str) -> Response:
+    return JSONResponse({'error': message}, status_code=413)
+
+async def read_body(request: Request, limit: int) -> bytes:
+    """The request body, raising PayloadTooLarge as soon as it is known to exceed limit bytes"""
+    length = request.headers.get('content-length', '')
+    if length.isdigit() and int(length) > limit:
+        raise PayloadTooLarge(f"Request bodies are limited to {limit} bytes")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise PayloadTooLarge(f"Request bodies are limited to {limit} bytes")
+    return bytes(body)
+
+def _api_number(value) -> float:
+    """Parse a JSON number (or numeric string), rejecting booleans and non-finite values"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise TypeError("Values must be numbers")
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("Values must be finite numbers")
+    return number
 
-@rt('/calculate-units-live')
-def get(amount: str = "", initial_amount: str = "", tariff_type: str = "new", **kwargs):
-    # Show calculation even if only initial_amount is provided
-    if (not amount or amount == "") and (not initial_amount or initial_amount == ""):
-        return Div()
+def _breakdown_finite(breakdown: Breakdown) -> bool:
+    """True when every number in breakdown, and in its initial/new parts, is finite"""
+    values = (*breakdown.tier_units, *breakdown.tier_costs, breakdown.subtotal, breakdown.vat_amount,
+              breakdown.total, breakdown.total_units or 0.0)
+    return (all(math.isfinite(value) for value in values)
+            and all(part is None or _breakdown_finite(part) for part in (breakdown.initial_breakdown, breakdown.new_breakdown)))
+
+def _finite_result(value: float, breakdown: Breakdown) -> tuple:
+    """(value, breakdown) unchanged; ValueError when finite inputs overflowed somewhere in them"""
+    if not (math.isfinite(value) and _breakdown_finite(breakdown)):
+        raise ValueError("Values are too large to calculate")
+    return value, breakdown
+
+def calculate_item(item) -> dict:
+    """Run one API calculation: {'units': ...} for cost, {'amount': ..., 'initial_amount': ...} for units"""
+    if not isinstance(item, dict):
+        return {'error': "Each calculation must be a JSON object"}
     
+    result = {'id': item['id']} if 'id' in item else {}
+    tariff_type = item.get('tariff_type', 'new')
     try:
-        amount_val = float(amount) if amount and amount != "" else 0
-        initial_val = float(initial_amount) if initial_amount and initial_amount != "" else 0
-        
-        # Show result if either amount or initial amount has a value
-        if amount_val == 0 and initial_val == 0:
-            return Div()
-            
-        result, breakdown = calculateUnitsFromAmount(amount_val, initial_val, tariff_type)
-        
-        tariff_desc = NEW_TARIFFS['description'] if tariff_type == 'new' else OLD_TARIFFS['description']
-        
-        # Create result text based on what was entered
-        if initial_val > 0 and amount_val > 0:
-            result_text = f"{result} kWh (Total: {breakdown['total']} RWF = {initial_val} + {amount_val})"
-            title = "Units Calculation Result"
-        elif initial_val > 0 and amount_val == 0:
-            result_text = f"{result} kWh from initial payment of {initial_val} RWF"
-            title = "Units from Initial Payment"
+        if not isinstance(tariff_type, str):
+            raise TypeError("tariff_type must be a string")
+        if 'units' in item:
+            amount, breakdown = _finite_result(*calculateAmountFromUnits(_api_number(item['units']), tariff_type))
+            note_calculation(tariff_type, 'cost')
+            result.update(type='cost', result=amount, breakdown=breakdown.as_dict())
+        elif 'amount' in item or 'initial_amount' in item:
+            units, breakdown = _finite_result(*calculateUnitsFromAmount(
+                _api_number(item.get('amount', 0)), _api_number(item.get('initial_amount', 0)), tariff_type
+            ))
+            note_calculation(tariff_type, 'units')
+            result.update(type='units', result=units, breakdown=breakdown.as_dict())
         else:
-            result_text = f"{result} kWh = {amount_val} RWF"
-            title = "Units Calculation Result"
-        
-        return Div(
-            Div(
-                H3(title),
-                P(result_text, cls='highlight'),
-                Small(f"Using {tariff_desc}", style='color: var(--muted-color);'),
-                cls='result-summary'
-            ),
-            create_breakdown_table(breakdown, False)
-        )
+            result['error'] = "Each calculation needs 'units' or 'amount'"
     except (ValueError, TypeError) as e:
-        return Div(P(f"Invalid input: Please enter valid numbers", cls='error'))
-
-@rt('/update-tariff')
-def get(tariff_type: str = "new", amount: str = "", initial_amount: str = "", units: str = "", **kwargs):
-    """Handle tariff type changes and recalculate results"""
-    results = []
+        note_invalid_input()
+        result['error'] = str(e)
     
-    # Recalculate units result if amount inputs have values
-    if (amount and amount != "") or (initial_amount and initial_amount != ""):
+    return result
+
+def _ndjson_results(lines: list) -> str:
+    """Calculate a group of NDJSON request lines into NDJSON response lines"""
+    out = []
+    for line in lines:
+        if not line.strip():
+            continue
         try:
-            amount_val = float(amount) if amount and amount != "" else 0
-            initial_val = float(initial_amount) if initial_amount and initial_amount != "" else 0
-            
-            if amount_val > 0 or initial_val > 0:
-                result, breakdown = calculateUnitsFromAmount(amount_val, initial_val, tariff_type)
-                tariff_desc = NEW_TARIFFS['description'] if tariff_type == 'new' else OLD_TARIFFS['description']
-                
-                # Create result text based on what was entered
-                if initial_val > 0 and amount_val > 0:
-                    result_text = f"{result} kWh (Total: {breakdown['total']} RWF = {initial_val} + {amount_val})"
-                    title = "Units Calculation Result"
-                elif initial_val > 0 and amount_val == 0:
-                    result_text = f"{result} kWh from initial payment of {initial_val} RWF"
-                    title = "Units from Initial Payment"
-                else:
-                    result_text = f"{result} kWh = {amount_val} RWF"
-                    title = "Units Calculation Result"
-                
-                units_result = Div(
-                    Div(
-                        H3(title),
-                        P(result_text, cls='highlight'),
-                        Small(f"Using {tariff_desc}", style='color: var(--muted-color);'),
-                        cls='result-summary'
-                    ),
-                    create_breakdown_table(breakdown, False),
-                    id='units-result'
-                )
-                results.append(units_result)
-        except (ValueError, TypeError):
-            results.append(Div(P("Invalid amount input", cls='error'), id='units-result'))
-    else:
-        results.append(Div(id='units-result'))
-    
-    # Recalculate cost result if units input has value
-    if units and units != "":
+            item = json.loads(line)
+        except ValueError:
+            out.append(json.dumps({'error': "Invalid JSON line"}))
+            continue
+        out.append(json.dumps(calculate_item(item)))
+    return ''.join(f"{line}\n" for line in out)
+
+class BodyStreamingResponse(StreamingResponse):
+    """StreamingResponse that leaves receive() to its body iterator so it can answer while the request streams in
+
+    The status goes out with the first chunk, so PayloadTooLarge before then is a 413; after it,
+    the stream ends with an error line.
+    """
+    async def __call__(self, scope, receive, send):
+        started = False
         try:
-            units_val = float(units)
-            
-            if units_val > 0:
-                result, breakdown = calculateAmountFromUnits(units_val, tariff_type)
-                tariff_desc = NEW_TARIFFS['description'] if tariff_type == 'new' else OLD_TARIFFS['description']
-                
-                cost_result = Div(
-                    Div(
-                        H3("Cost Calculation Result"),
-                        P(f"{units_val} kWh = {result} RWF", cls='highlight'),
-                        Small(f"Using {tariff_desc}", style='color: var(--muted-color);'),
-                        cls='result-summary'
-                    ),
-                    create_breakdown_table(breakdown),
-                    id='cost-result'
-                )
-                results.append(cost_result)
-        except (ValueError, TypeError):
-            results.append(Div(P("Invalid units input", cls='error'), id='cost-result'))
-    else:
-        results.append(Div(id='cost-result'))
-    
-    return Div(*results)
+            async for chunk in self.body_iterator:
+                if not started:
+                    await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+                    started = True
+                await send({'type': 'http.response.body', 'body': chunk.encode(self.charset), 'more_body': True})
+        except PayloadTooLarge as e:
+            if not started:
+                return await payload_too_large(str(e))(scope, receive, send)
+            await send({'type': 'http.response.body', 'body': f"{json.dumps({'error': str(e)})}\n".encode(), 'more_body': True})
+        if not started:
+            await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+async def api_calculate(request: Request):
+    """Calculate a JSON array of calculations and return a JSON array of results"""
+    with stage('parse'):
+        try:
+            items = json.loads(await read_body(request, API_MAX_BODY))
+        except PayloadTooLarge as e:
+            return payload_too_large(str(e))
+        except ValueError:
+            items = None
+    if not isinstance(items, list):
+        note_invalid_input()
+        return JSONResponse({'error': "Body must be a JSON array of calculations"}, status_code=400)
+    if len(items) > API_MAX_BATCH:
+        return payload_too_large(f"At most {API_MAX_BATCH} calculations per request, use /api/v1/calculate/stream for more")
+    
+    with stage('calc'):
+        results = [calculate_item(item) for item in items]
+    with stage('render'):
+        return JSONResponse(results)
+
+async def api_calculate_stream(request: Request):
+    """Calculate newline-delimited JSON calculations, streaming one result line back per input line"""
+    async def results():
+        pending = b''
+        async for chunk in request.stream():
+            *lines, pending = (pending + chunk).split(b'\n')
+            if len(pending) > API_MAX_LINE or any(len(line) > API_MAX_LINE for line in lines):
+                raise PayloadTooLarge(f"Lines are limited to {API_MAX_LINE} bytes")
+            if lines:
+                yield _ndjson_results(lines)
+        if pending:
+            yield _ndjson_results([pending])
+    
+    return BodyStreamingResponse(results(), media_type='application/x-ndjson')
+
+# Plain Starlette routes: FastHTML handlers read the whole body up front to bind form fields
+app.add_route(Route('/api/v1/calculate', api_calculate, methods=['POST']))
+app.add_route(Route('/api/v1/calculate/stream', api_calculate_stream, methods=['POST']))
+
+@rt('/metrics')
+def get():
+    """Prometheus scrape endpoint, summed over every worker sharing METRICS_DIR"""
+    return Response(worker_metrics.exposition(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     serve()
\ No newline at end of file
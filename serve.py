@@ -0,0 +1,239 @@
+"""Production launcher: a preforking supervisor running uvicorn workers
+
+    python serve.py
+    WEB_CONCURRENCY=4 PORT=10000 python serve.py
+
+The supervisor imports the app once (tariff tables, breakdown templates, stylesheet) and
+then forks the workers, so they share that memory copy-on-write and accept connections
+from one listening socket. Workers run uvicorn on uvloop and httptools when installed
+(`uvicorn[standard]`) and are restarted if they die. SIGHUP reloads gracefully: the
+supervisor re-executes itself with the socket still open, starts workers on the new code
+and lets the old ones finish their requests. SIGTERM or SIGINT drains the workers and exits.
+
+Settings come from the environment:
+
+    WEB_CONCURRENCY     worker processes (default: CPU count)
+    HOST, PORT          listen address (default 0.0.0.0:8000)
+    BACKLOG             listen queue length (default 2048)
+    KEEP_ALIVE          idle keep-alive timeout in seconds (default 65)
+    LIMIT_CONCURRENCY   open connections per worker before it answers 503 (default unlimited)
+    MAX_REQUESTS        requests before a worker is replaced, with up to 10% jitter (default unlimited)
+    GRACEFUL_TIMEOUT    seconds workers get to finish requests on shutdown or reload (default 30)
+    ACCESS_LOG          1 to log every request (default off)
+"""
+import gc
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import uvicorn
+
+logger = logging.getLogger('serve')
+
+# Set by a reloading supervisor for the process it re-executes into
+SOCKET_FD_ENV = 'SERVE_SOCKET_FD'
+RETIRING_ENV = 'SERVE_RETIRING_PIDS'
+
+def _env_int(name: str, default: int | None) -> int | None:
+    value = os.environ.get(name, '').strip()
+    return int(value) if value else default
+
+def settings() -> dict:
+    """Launcher settings from the environment"""
+    return {
+        'workers': _env_int('WEB_CONCURRENCY', os.cpu_count() or 1),
+        'host': os.environ.get('HOST', '0.0.0.0'),
+        'port': _env_int('PORT', 8000),
+        'backlog': _env_int('BACKLOG', 2048),
+        'keep_alive': _env_int('KEEP_ALIVE', 65),
+        'limit_concurrency': _env_int('LIMIT_CONCURRENCY', None),
+        'max_requests': _env_int('MAX_REQUESTS', None),
+        'graceful_timeout': _env_int('GRACEFUL_TIMEOUT', 30),
+        'access_log': os.environ.get('ACCESS_LOG', '0') == '1',
+    }
+
+def metrics_dir(workers: int, reloading: bool):
+    """Give several workers a shared, initially empty METRICS_DIR unless one is configured"""
+    if workers < 2:
+        return
+    directory = os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), f'calculator-metrics-{os.getpid()}'))
+    if reloading or not os.path.isdir(directory):
+        # Counters of the previous workers keep counting after a reload
+        return
+    for name in os.listdir(directory):
+        if name.startswith('metrics-'):
+            os.unlink(os.path.join(directory, name))
+
+def preload():
+    """Import the app in the supervisor and build what workers would otherwise build lazily"""
+    import main
+
+    main._route_paths()
+    for tariff_type in main.TARIFF_SCHEDULES:
+        # Tier boundaries of every schedule, so each breakdown table shape gets its template
+        limits = main.get_schedule(tariff_type).limits
+        units = sorted({1.0, *[limit + 1.0 for limit in limits]})
+        for lvl in (0, 2):
+            for units_val in units:
+                main.cost_result(units_val, tariff_type, lvl)
+                amount_val = main.calculateAmountFromUnits(units_val, tariff_type)[0]
+                for initial_val in (0, amount_val):
+                    main.units_result(amount_val, initial_val, tariff_type, lvl)
+                main.units_result(0, amount_val, tariff_type, lvl)
+    # Keep the preloaded objects out of garbage collection so workers do not dirty their pages
+    gc.freeze()
+    return main.app
+
+def retire_metrics(pid: int):
+    """Fold an exited worker's metrics file into the archive, before its pid can be reused"""
+    import main
+
+    main.worker_metrics.retire(pid)
+
+def listen(host: str, port: int, backlog: int) -> socket.socket:
+    """The listening socket, inherited from the previous supervisor after a reload"""
+    fd = os.environ.pop(SOCKET_FD_ENV, None)
+    if fd is not None:
+        return socket.socket(fileno=int(fd))
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    return sock
+
+def run_worker(app, sock: socket.socket, options: dict):
+    """Worker process body: serve on the shared socket until told to stop"""
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, signal.SIG_DFL)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    max_requests = options['max_requests']
+    config = uvicorn.Config(
+        app,
+        backlog=options['backlog'],
+        timeout_keep_alive=options['keep_alive'],
+        limit_concurrency=options['limit_concurrency'],
+        limit_max_requests=max_requests,
+        limit_max_requests_jitter=max_requests // 10 if max_requests else 0,
+        timeout_graceful_shutdown=options['graceful_timeout'],
+        access_log=options['access_log'],
+        server_header=False,
+        lifespan='off',
+    )
+    uvicorn.Server(config).run(sockets=[sock])
+
+class Supervisor:
+    """Forks the workers, replaces the ones that exit and handles shutdown and reload signals"""
+
+    def __init__(self, app, sock: socket.socket, options: dict, retiring: set):
+        self.app = app
+        self.sock = sock
+        self.options = options
+        self.workers = {}
+        self.retiring = retiring
+        self.signal = None
+        self.stopping = False
+
+    def spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                run_worker(self.app, self.sock, self.options)
+                code = 0
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def reap(self):
+        """Collect exited workers; returns how many of the current ones died"""
+        died = 0
+        while self.workers or self.retiring:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            retire_metrics(pid)
+            self.retiring.discard(pid)
+            if self.workers.pop(pid, None) is not None and not self.stopping:
+                logger.warning("Worker %d exited with status %d", pid, os.waitstatus_to_exitcode(status))
+                died += 1
+        return died
+
+    def stop(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def shutdown(self):
+        """Let every worker finish its requests, killing stragglers after the graceful timeout"""
+        self.stopping = True
+        self.stop([*self.workers, *self.retiring])
+        deadline = time.monotonic() + self.options['graceful_timeout'] + 5
+        while (self.workers or self.retiring) and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in [*self.workers, *self.retiring]:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def reload(self):
+        """Re-execute the supervisor on the current code; its new workers replace these"""
+        check = subprocess.run([sys.executable, '-c', 'import main'], cwd=os.path.dirname(os.path.abspath(__file__)))
+        if check.returncode != 0:
+            logger.error("Reload aborted: the app failed to import")
+            return
+        self.sock.set_inheritable(True)
+        os.environ[SOCKET_FD_ENV] = str(self.sock.fileno())
+        os.environ[RETIRING_ENV] = ','.join(map(str, [*self.workers, *self.retiring]))
+        os.execv(sys.executable, [sys.executable, os.path.abspath(__file__), *sys.argv[1:]])
+
+    def handle(self, signum, frame):
+        self.signal = signum
+
+    def run(self):
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, self.handle)
+        for _ in range(self.options['workers']):
+            self.spawn()
+        # Workers of the supervisor this one replaced drain once the new ones are up
+        self.stop(self.retiring)
+
+        while True:
+            signum, self.signal = self.signal, None
+            if signum in (signal.SIGTERM, signal.SIGINT):
+                self.shutdown()
+                return
+            if signum == signal.SIGHUP:
+                self.reload()
+
+            for _ in range(self.reap()):
+                self.spawn()
+            # Back off when workers die right after starting
+            if any(time.monotonic() - started < 1 for started in self.workers.values()):
+                time.sleep(1)
+            time.sleep(0.5)
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [serve] %(message)s')
+    options = settings()
+    retiring = {int(pid) for pid in os.environ.pop(RETIRING_ENV, '').split(',') if pid}
+    metrics_dir(options['workers'], reloading=bool(retiring))
+    app = preload()
+    sock = listen(options['host'], options['port'], options['backlog'])
+    logger.info("Serving on %s:%d with %d workers", options['host'], options['port'], options['workers'])
+    Supervisor(app, sock, options, retiring).run()
+
+if __name__ == '__main__':
+    main()
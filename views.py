@@ -0,0 +1,1022 @@
+"""The calculator page and its live HTMX fragments, on the engine and FastHTML's core
+
+main.py serves this app with instrumentation, the JSON API and the /live channel on top;
+the Netlify function serves it as is, so it imports only what the page needs.
+"""
+from fasthtml.core import FastHTML, HttpHeader, _xt_cts, fh_cfg, htmx_exts
+from fasthtml.components import (
+    A, Article, Div, H1, H2, H3, H4, Head, Header, Hr, Input, Label, Link, Main, P, Section, Small,
+    Strong, Table, Tbody, Td, Th, Thead, Title, Tr
+)
+from fasthtml.xtend import Form, Script, Style
+from fastcore.utils import listify
+from fastcore.xml import NotStr, to_xml
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, RedirectResponse, Response
+from starlette.routing import Mount, Route
+from starlette.staticfiles import StaticFiles
+import contextvars
+import functools
+import gzip
+import hashlib
+import math
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from engine import *
+
+# Request instrumentation hooks. main.py's middlewares set these context variables per request;
+# without them (as in the Netlify function) stage() and note() do nothing.
+_stage_timings = contextvars.ContextVar('stage_timings', default=None)
+
+class _Stage:
+    __slots__ = ('timings', 'name', 'start')
+
+    def __init__(self, timings: dict, name: str):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timings[self.name] = self.timings.get(self.name, 0.0) + time.perf_counter() - self.start
+
+class _NoStage:
+    __slots__ = ()
+    def __enter__(self): pass
+    def __exit__(self, *exc_info): pass
+
+_NO_STAGE = _NoStage()
+
+def stage(name: str):
+    """Time a block as one stage of the current request (summed if it runs more than once)"""
+    timings = _stage_timings.get()
+    return _NO_STAGE if timings is None else _Stage(timings, name)
+
+_request_events = contextvars.ContextVar('request_events', default=None)
+
+def note(metric: str, *labels: tuple):
+    """Count an event against the current request; it is applied when the response is done"""
+    events = _request_events.get()
+    if events is not None:
+        key = (metric, labels)
+        events[key] = events.get(key, 0) + 1
+
+def note_calculation(tariff_type: str, kind: str):
+    note('calculator_calculations_total', ('tariff_type', tariff_key(tariff_type)), ('kind', kind))
+
+def note_invalid_input():
+    note('calculator_invalid_input_errors_total')
+
+def tariff_version() -> int:
+    """Changes whenever a compiled tariff schedule is added, replaced or removed"""
+    return hash(tuple(TARIFF_SCHEDULES.items()))
+
+# Stable across processes and restarts (unlike hash()), and changes with the code that renders
+APP_VERSION = hashlib.sha256(b''.join(open(path, 'rb').read() for path in (__file__, sys.modules['engine'].__file__))).hexdigest()
+
+@functools.cache
+def _etag_salt(version: int) -> bytes:
+    """Digest of the tariff definitions and APP_VERSION, memoized per tariff_version()"""
+    return hashlib.sha256(repr(sorted(TARIFF_SCHEDULES.items())).encode() + APP_VERSION.encode()).digest()
+
+def fragment_etag(key: tuple) -> str:
+    """Strong ETag for a fragment from its normalized inputs and the tariff version"""
+    return f'"{hashlib.sha256(_etag_salt(tariff_version()) + repr(key).encode()).hexdigest()[:32]}"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """True when the request's If-None-Match already names etag"""
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+
+class FragmentCache:
+    """Bounded LRU of rendered HTMX fragments keyed on normalized inputs"""
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.hits = self.misses = self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = tariff_version()
+
+    def get_or_render(self, key: tuple, render) -> str:
+        """Return the cached HTML for key, rendering and storing it on a miss"""
+        version = tariff_version()
+        with self._lock:
+            # Drop everything rendered against an older tariff definition
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+        
+        html = render()
+        with self._lock:
+            if version == self._version:
+                self._entries[key] = html
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'maxsize': self.maxsize,
+                'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+fragment_cache = FragmentCache(int(os.environ.get('FRAGMENT_CACHE_SIZE', 4096)))
+FRAGMENT_CACHE_CONTROL = f"public, max-age={int(os.environ.get('FRAGMENT_MAX_AGE', 3600))}"
+
+def is_htmx_fragment(request: Request) -> bool:
+    """True when FastHTML will send the response as a bare HTMX fragment rather than a full page"""
+    return 'HX-Request' in request.headers and 'HX-History-Restore-Request' not in request.headers
+
+def cached_fragment(request: Request, key: tuple, render):
+    """Serve an HTMX fragment from fragment_cache; full-page and non-finite requests render directly
+
+    render(lvl) gets the nesting level the fragment is serialized at, or None inside a full page.
+    """
+    if not is_htmx_fragment(request):
+        return render(None)
+    if not all(math.isfinite(v) for v in key if isinstance(v, float)):
+        return render(0)
+    
+    # The fragment depends only on key and the tariffs, so browsers and CDN edges may reuse it
+    etag = fragment_etag(key)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': FRAGMENT_CACHE_CONTROL,
+                                                  'Vary': 'HX-Request, HX-History-Restore-Request'})
+    
+    return fragment_html(key, render), HttpHeader('ETag', etag), HttpHeader('Cache-Control', FRAGMENT_CACHE_CONTROL)
+
+def fragment_html(key: tuple, render):
+    """The fragment for key serialized at the top level, from fragment_cache when its numbers are finite"""
+    if not all(math.isfinite(v) for v in key if isinstance(v, float)):
+        return render(0)
+    
+    def render_html():
+        fragment = render(0)
+        with stage('render'):
+            return to_xml(fragment, indent=fh_cfg.indent)
+    
+    return NotStr(fragment_cache.get_or_render(key, render_html))
+
+# Pages that do not depend on the request are rendered once per tariff version and kept as bytes
+# with precompressed variants. Compression runs once per page, so it favours size over speed, but
+# brotli's top quality costs far more than it saves on a page this small.
+PAGE_GZIP_LEVEL = 9
+PAGE_BROTLI_QUALITY = 9
+
+def _preferred_encoding(accept_encoding: str, available) -> str:
+    """Best of the available 'br' / 'gzip' variants that Accept-Encoding allows, else 'identity'"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding.strip().lower()] = q
+    for coding in ('br', 'gzip'):
+        if coding in available and weights.get(coding, weights.get('*', 0)) > 0:
+            return coding
+    return 'identity'
+
+class CachedPage:
+    """Rendered page bytes plus gzip/brotli variants, each with its own strong ETag"""
+    __slots__ = ('variants',)
+
+    def __init__(self, html: str):
+        body = html.encode()
+        tag = hashlib.sha256(body).hexdigest()[:32]
+        self.variants = {'identity': (body, f'"{tag}"'), 'gzip': (gzip.compress(body, PAGE_GZIP_LEVEL, mtime=0), f'"{tag}-gzip"')}
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body, quality=PAGE_BROTLI_QUALITY), f'"{tag}-br"')
+
+    def response(self, request: Request) -> Response:
+        """The variant the client accepts, or 304 when its If-None-Match already has it"""
+        encoding = _preferred_encoding(request.headers.get('accept-encoding', ''), self.variants)
+        body, etag = self.variants[encoding]
+        headers = {'ETag': etag, 'Cache-Control': 'no-cache',
+                   'Vary': 'HX-Request, HX-History-Restore-Request, Accept-Encoding'}
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(body, headers=headers)
+
+page_cache = FragmentCache(64)
+
+def _cached_page(request: Request, render) -> CachedPage:
+    """The page for the request's path from page_cache, rendered with FastHTML's page wrapper on a miss"""
+    # The query string and Host header never reach the page: its canonical link is the bare path
+    request.canonical = request.url.path
+    key = (request.url.path, is_htmx_fragment(request))
+    return page_cache.get_or_render(key, lambda: CachedPage(_xt_cts(request, render())))
+
+def cached_page(request: Request, render) -> Response:
+    """Serve a request-independent page from page_cache"""
+    return _cached_page(request, render).response(request)
+
+def prerender_page(app: FastHTML, path: str, render):
+    """Render a page into page_cache at startup, so no request waits for it"""
+    request = Request({'type': 'http', 'method': 'GET', 'path': path, 'query_string': b'', 'headers': [], 'app': app})
+    # What FastHTML's route wrapper sets on a request before calling the handler
+    request.hdrs, request.ftrs = listify(app.hdrs), listify(app.ftrs)
+    request.htmlkw, request.bodykw = app.htmlkw, app.bodykw
+    _cached_page(request, render)
+
+def tier_rows(values: Breakdown, tariff_rates: tuple, tariff_limits: tuple) -> list:
+    """Create one table row per tier that has units in it"""
+    tier_starts = (0,) + tuple(tariff_limits)
+    rows = []
+    for i, (rate, units, cost) in enumerate(zip(tariff_rates, values.tier_units, values.tier_costs), 1):
+        if units <= 0:
+            continue
+        tier_range = f"{tier_starts[i - 1]}-{tariff_limits[i - 1]}" if i <= len(tariff_limits) else f"{tier_starts[-1]}+"
+        rows.append(
+            Tr(
+                Td(f"Tier {i} ({tier_range} kWh)"),
+                Td(f"{rate}"),
+                Td(f"{units:.2f}"),
+                Td(f"{cost:.2f}")
+            )
+        )
+    return rows
+
+def create_breakdown_table(breakdown: Breakdown, is_from_units: bool = True):
+    """Create a detailed breakdown table"""
+    
+    # If we have both payments, show separate breakdowns
+    if breakdown.has_both_payments:
+        return create_dual_breakdown_table(breakdown)
+    
+    # Get tariff info
+    tariff_rates = breakdown.tariff_rates
+    tariff_limits = breakdown.tariff_limits
+    
+    table_content = [
+        Article(
+            H4("Tier Breakdown"),
+            Table(
+                Thead(
+                    Tr(
+                        Th("Tier"),
+                        Th("Rate (RWF/kWh)"),
+                        Th("Units Used"),
+                        Th("Cost (RWF)")
+                    )
+                ),
+                Tbody(
+                    *tier_rows(breakdown, tariff_rates, tariff_limits),
+                    Tr(
+                        Td(Strong("Subtotal (Units)")),
+                        Td(""),
+                        Td(Strong(f"{breakdown.total_units:.2f} kWh")),
+                        Td("")
+                    ),
+                    Tr(
+                        Td(Strong("Subtotal (Cost)")),
+                        Td(""),
+                        Td(""),
+                        Td(Strong(f"{breakdown.subtotal:.2f}"))
+                    ),
+                    Tr(
+                        Td(f"VAT ({VAT*100}%)"),
+                        Td(""),
+                        Td(""),
+                        Td(f"{breakdown.vat_amount:.2f}")
+                    ),
+                    Tr(
+                        Td(Strong("Total")),
+                        Td(""),
+                        Td(""),
+                        Td(Strong(f"{breakdown.total:.2f}"))
+                    )
+                )
+            )
+        )
+    ]
+    
+    # Add payment breakdown if applicable (for units from amount with initial payment)
+    if breakdown.initial_amount is not None and breakdown.initial_amount > 0 and not breakdown.has_both_payments:
+        table_content.append(
+            Article(
+                H4("Payment Summary"),
+                Table(
+                    Tbody(
+                        Tr(
+                            Td("Initial Payment:"),
+                            Td(f"{breakdown.initial_amount:.2f} RWF")
+                        ),
+                        Tr(
+                            Td("New Payment:"),
+                            Td(f"{breakdown.new_amount:.2f} RWF")
+                        ),
+                        Tr(
+                            Td(Strong("Total Available:")),
+                            Td(Strong(f"{breakdown.total:.2f} RWF"))
+                        )
+                    )
+                )
+            )
+        )
+    
+    return Div(*table_content)
+
+def create_dual_breakdown_table(breakdown: Breakdown):
+    """Create separate breakdown tables for initial and new payments"""
+    tables = []
+    
+    # Get tariff info
+    tariff_rates = breakdown.tariff_rates
+    tariff_limits = breakdown.tariff_limits
+    
+    # Payment Summary first
+    tables.append(
+        Article(
+            H4("Payment Summary"),
+            Table(
+                Tbody(
+                    Tr(
+                        Td("Initial Payment:"),
+                        Td(f"{breakdown.initial_amount:.2f} RWF"),
+                        Td(f"→ {breakdown.initial_breakdown.total_units:.2f} kWh")
+                    ),
+                    Tr(
+                        Td("New Payment:"),
+                        Td(f"{breakdown.new_amount:.2f} RWF"),
+                        Td(f"→ {breakdown.new_breakdown.total_units:.2f} kWh")
+                    ),
+                    Tr(
+                        Td(Strong("Total:")),
+                        Td(Strong(f"{breakdown.total:.2f} RWF")),
+                        Td(Strong(f"→ {breakdown.total_units:.2f} kWh"))
+                    )
+                )
+            )
+        )
+    )
+    
+    # New Payment Breakdown (moved up)
+    if breakdown.new_breakdown and breakdown.new_amount > 0:
+        new = breakdown.new_breakdown
+        tables.append(
+            Article(
+                H4("New Payment Tier Breakdown"),
+                Table(
+                    Thead(
+                        Tr(
+                            Th("Tier"),
+                            Th("Rate (RWF/kWh)"),
+                            Th("Units Added"),
+                            Th("Cost (RWF)")
+                        )
+                    ),
+                    Tbody(
+                        *tier_rows(new, tariff_rates, tariff_limits),
+                        Tr(
+                            Td(Strong("Subtotal (Units)")),
+                            Td(""),
+                            Td(Strong(f"{new.total_units:.2f} kWh")),
+                            Td("")
+                        ),
+                        Tr(
+                            Td(Strong("Subtotal (Cost)")),
+                            Td(""),
+                            Td(""),
+                            Td(Strong(f"{new.subtotal:.2f}"))
+                        ),
+                        Tr(
+                            Td(f"VAT ({VAT*100}%)"),
+                            Td(""),
+                            Td(""),
+                            Td(f"{new.vat_amount:.2f}")
+                        ),
+                        Tr(
+                            Td(Strong("Total")),
+                            Td(""),
+                            Td(""),
+                            Td(Strong(f"{new.total:.2f}"))
+                        )
+                    )
+                )
+            )
+        )
+    
+    # Initial Payment Breakdown
+    if breakdown.initial_breakdown and breakdown.initial_amount > 0:
+        initial = breakdown.initial_breakdown
+        tables.append(
+            Article(
+                H4("Initial Payment Tier Breakdown"),
+                Table(
+                    Thead(
+                        Tr(
+                            Th("Tier"),
+                            Th("Rate (RWF/kWh)"),
+                            Th("Units Used"),
+                            Th("Cost (RWF)")
+                        )
+                    ),
+                    Tbody(
+                        *tier_rows(initial, tariff_rates, tariff_limits),
+                        Tr(
+                            Td(Strong("Subtotal (Units)")),
+                            Td(""),
+                            Td(Strong(f"{initial.total_units:.2f} kWh")),
+                            Td("")
+                        ),
+                        Tr(
+                            Td(Strong("Subtotal (Cost)")),
+                            Td(""),
+                            Td(""),
+                            Td(Strong(f"{initial.subtotal:.2f}"))
+                        ),
+                        Tr(
+                            Td(f"VAT ({VAT*100}%)"),
+                            Td(""),
+                            Td(""),
+                            Td(f"{initial.vat_amount:.2f}")
+                        ),
+                        Tr(
+                            Td(Strong("Total")),
+                            Td(""),
+                            Td(""),
+                            Td(Strong(f"{initial.total:.2f}"))
+                        )
+                    )
+                )
+            )
+        )
+    
+    # Combined Total Breakdown
+    tables.append(
+        Article(
+            H4("Combined Total Breakdown"),
+            Table(
+                Thead(
+                    Tr(
+                        Th("Tier"),
+                        Th("Rate (RWF/kWh)"),
+                        Th("Total Units"),
+                        Th("Total Cost (RWF)")
+                    )
+                ),
+                Tbody(
+                    *tier_rows(breakdown, tariff_rates, tariff_limits),
+                    Tr(
+                        Td(Strong("Grand Total (Units)")),
+                        Td(""),
+                        Td(Strong(f"{breakdown.total_units:.2f} kWh")),
+                        Td("")
+                    ),
+                    Tr(
+                        Td(Strong("Grand Total (Cost)")),
+                        Td(""),
+                        Td(""),
+                        Td(Strong(f"{breakdown.subtotal:.2f}"))
+                    ),
+                    Tr(
+                        Td(f"VAT ({VAT*100}%)"),
+                        Td(""),
+                        Td(""),
+                        Td(f"{breakdown.vat_amount:.2f}")
+                    ),
+                    Tr(
+                        Td(Strong("Final Total")),
+                        Td(""),
+                        Td(""),
+                        Td(Strong(f"{breakdown.total:.2f}"))
+                    )
+                )
+            )
+        )
+    )
+    
+    return Div(*tables)
+
+# Precompiled breakdown tables: the FT renderers above run once per table shape and nesting
+# level with numbered slots in place of the numbers, and the HTML becomes a str.format template
+BREAKDOWN_TEMPLATES = os.environ.get('BREAKDOWN_TEMPLATES', '1') != '0'
+
+class _Slot:
+    """Stand-in for a number while a template is compiled; compares like the number, formats as a field"""
+    __slots__ = ('index', 'value')
+
+    def __init__(self, index: int, value: float):
+        self.index = index
+        self.value = value
+
+    def __format__(self, spec: str) -> str:
+        return f"\x00{self.index}:{spec}\x00"
+
+    def __lt__(self, other): return self.value < other
+    def __le__(self, other): return self.value <= other
+    def __gt__(self, other): return self.value > other
+    def __ge__(self, other): return self.value >= other
+
+def _breakdown_numbers(breakdown: Breakdown) -> list:
+    """Every number a breakdown table can show, in slot order"""
+    numbers = [*breakdown.tier_units, *breakdown.tier_costs, breakdown.subtotal, breakdown.vat_amount,
+               breakdown.total, breakdown.total_units, breakdown.initial_amount, breakdown.new_amount]
+    for part in (breakdown.initial_breakdown, breakdown.new_breakdown):
+        if part is not None:
+            numbers += _breakdown_numbers(part)
+    return numbers
+
+def _slotted_breakdown(breakdown: Breakdown, slots) -> Breakdown:
+    """Copy of breakdown with its numbers replaced by the next slots, in _breakdown_numbers order"""
+    def take(count):
+        return tuple([next(slots) for _ in range(count)])
+    
+    tiers = breakdown.schedule.tiers
+    tier_units, tier_costs = take(tiers), take(tiers)
+    subtotal, vat_amount, total, total_units, initial_amount, new_amount = take(6)
+    initial = _slotted_breakdown(breakdown.initial_breakdown, slots) if breakdown.initial_breakdown is not None else None
+    new = _slotted_breakdown(breakdown.new_breakdown, slots) if breakdown.new_breakdown is not None else None
+    return Breakdown(tier_units, tier_costs, subtotal, vat_amount, total,
+                     None if breakdown.total_units is None else total_units, breakdown.schedule, breakdown.tariff_type,
+                     None if breakdown.initial_amount is None else initial_amount,
+                     None if breakdown.new_amount is None else new_amount, initial, new)
+
+def _tier_mask(breakdown: Breakdown) -> tuple:
+    return tuple([not units <= 0 for units in breakdown.tier_units])
+
+def _table_shape(breakdown: Breakdown) -> tuple:
+    """Everything besides the numbers that decides the markup of a breakdown table"""
+    shape = [breakdown.schedule, _tier_mask(breakdown), breakdown.has_both_payments,
+             breakdown.initial_amount is not None and breakdown.initial_amount > 0]
+    for part, paid in ((breakdown.new_breakdown, breakdown.new_amount), (breakdown.initial_breakdown, breakdown.initial_amount)):
+        shape.append(_tier_mask(part) if part and paid > 0 else None)
+    return tuple(shape)
+
+_table_templates = {}
+
+def render_breakdown_table(breakdown: Breakdown, lvl: int) -> NotStr:
+    """create_breakdown_table as HTML serialized at nesting level lvl, from a precompiled template"""
+    numbers = _breakdown_numbers(breakdown)
+    key = (_table_shape(breakdown), lvl, fh_cfg.indent)
+    template = _table_templates.get(key)
+    if template is None:
+        slots = iter([_Slot(i, value) for i, value in enumerate(numbers)])
+        html = to_xml(create_breakdown_table(_slotted_breakdown(breakdown, slots)), lvl=lvl, indent=fh_cfg.indent)
+        parts = html.split('\x00')
+        parts[::2] = [part.replace('{', '{{').replace('}', '}}') for part in parts[::2]]
+        parts[1::2] = ['{' + field + '}' for field in parts[1::2]]
+        template = _table_templates[key] = ''.join(parts)
+    return NotStr(template.format(*numbers))
+
+def breakdown_table(breakdown: Breakdown, lvl: int | None):
+    """Breakdown table for a result serialized at lvl; None (full pages) builds the FT tree"""
+    if lvl is None or not BREAKDOWN_TEMPLATES:
+        return create_breakdown_table(breakdown)
+    return render_breakdown_table(breakdown, lvl)
+
+# App styles live in assets/styles.css and are served from memory under a content-hashed URL, so
+# the URL changes with the content and browsers can cache it forever. Nothing is written to disk,
+# which keeps read-only deployments such as the Netlify function working.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+STYLESHEET_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets', 'styles.css')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+def hashed_name(path: str, content: bytes) -> str:
+    """File name of path with the first 12 hex digits of content's SHA-256 before the extension"""
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = os.path.splitext(os.path.basename(path))
+    return f'{stem}.{digest}{ext}'
+
+with open(STYLESHEET_SOURCE, 'rb') as f:
+    STYLESHEET = f.read()
+STYLESHEET_URL = f'/static/{hashed_name(STYLESHEET_SOURCE, STYLESHEET)}'
+STYLESHEET_ETAG = f'"{STYLESHEET_URL.rsplit(".", 2)[1]}"'
+
+async def stylesheet(request: Request) -> Response:
+    if etag_matches(request, STYLESHEET_ETAG):
+        return Response(status_code=304, headers={'ETag': STYLESHEET_ETAG, 'Cache-Control': IMMUTABLE_CACHE_CONTROL})
+    return Response(STYLESHEET, media_type='text/css', headers={'ETag': STYLESHEET_ETAG, 'Cache-Control': IMMUTABLE_CACHE_CONTROL})
+
+# Opt-in live channel, LIVE_WEBSOCKET=1: the page keeps one WebSocket to /live open through the
+# HTMX ws extension and sends field changes over it instead of a GET per pause in typing
+LIVE_WEBSOCKET = os.environ.get('LIVE_WEBSOCKET') == '1'
+
+def live_request(path: str, target: str) -> dict:
+    """Attributes that send an input's changes: a GET of path into target, or a message on /live"""
+    if LIVE_WEBSOCKET:
+        return {'ws_send': True}
+    return {'hx_get': path, 'hx_target': target}
+
+def live_form(path: str, target: str, trigger: str, include: str) -> dict:
+    """Attributes for a form whose fields feed one result: a GET of path with all of them, in document order"""
+    if LIVE_WEBSOCKET:
+        return {}
+    return {'hx_get': path, 'hx_target': target, 'hx_trigger': trigger, 'hx_include': include}
+
+def live_field(trigger: str, include: str) -> dict:
+    """Attributes for a field of a live_form(): over the WebSocket each field sends its own message"""
+    if LIVE_WEBSOCKET:
+        return {'ws_send': True, 'hx_trigger': trigger, 'hx_include': include}
+    return {}
+
+def index_page():
+    """The calculator page; nothing in it depends on the request"""
+    return Title('Rwanda Electricity Calculator'),Head(
+            # Favicon links for various devices/browsers
+            Link(rel="icon", href="/static/favicon.ico", type="image/x-icon"),  # Default ICO
+            Link(rel="icon", type="image/png", sizes="16x16", href="/static/favicon-16x16.png"),
+            Link(rel="icon", type="image/png", sizes="32x32", href="/static/favicon-32x32.png"),
+            Link(rel="apple-touch-icon", sizes="180x180", href="/static/apple-touch-icon.png"),  # iOS Safari
+            Link(rel="icon", type="image/png", sizes="192x192", href="/static/android-chrome-192x192.png"),  # Android Chrome
+            Link(rel="icon", type="image/png", sizes="512x512", href="/static/android-chrome-512x512.png"),  # Android Chrome (high-res)
+            Link(rel="manifest", href="/static/site.webmanifest"),  # Web App Manifest for PWA
+            Link(rel="stylesheet", href=STYLESHEET_URL),
+            *([Script(src=htmx_exts['ws'])] if LIVE_WEBSOCKET else []),
+        ),Main(
+        Header(
+            H1('Rwanda Energy Group Calculator'),
+            P('Calculate electricity costs and units with detailed tier breakdown'),
+            P(A('View Official REG Tariffs', href='https://www.reg.rw/customer-service/tariffs/', target='_blank')),
+            P(A('See this announcement for new tariffs', href='https://rdjarbeng.com/rura-announces-revised-electricity-end-user-tariffs-effective-october-2025/', target='_blank')),
+            
+            # Tariff Toggle - FIXED
+            Article(
+                H4("Tariff Selection"),
+                Div(
+                    Label(
+                        Input(
+                            type='radio', 
+                            name='tariff_type',  # Changed from 'tariff-type'
+                            value='new',
+                            checked=True,
+                            **live_request('/update-tariff', '#units-result, #cost-result'),
+                            hx_trigger='change',
+                            hx_include='#amount-input, #initial-amount-input, #units-input, input[name="tariff_type"]:checked'
+                        ),
+                        f" {NEW_TARIFFS['description']} (Current)"
+                    ),
+                    Label(
+                        Input(
+                            type='radio', 
+                            name='tariff_type',  # Changed from 'tariff-type'
+                            value='old',
+                            **live_request('/update-tariff', '#units-result, #cost-result'),
+                            hx_trigger='change',
+                            hx_include='#amount-input, #initial-amount-input, #units-input, input[name="tariff_type"]:checked'
+                        ),
+                        f" {OLD_TARIFFS['description']}"
+                    ),
+                    style='display: flex; gap: 2rem; margin-top: 0.5rem;'
+                ),
+                Small("Switch between old and new tariff structures to compare prices"),
+                cls='tariff-selector'
+            )
+        ),
+        
+        Div(
+            Div(
+                Section(
+                    H2('Calculate Units from Cost'),
+                    Form(
+                        Div(
+                            Label('Enter amount (RWF):', For='amount-input'),
+                            Input(
+                                type='number', 
+                                id='amount-input',
+                                name='amount', 
+                                placeholder='0.00', 
+                                min='0', 
+                                step='0.01',
+                                **live_field('input changed delay:300ms', 'this, #initial-amount-input, input[name="tariff_type"]:checked'),
+                                style='max-width: 300px;'
+                            ),
+                            Small('Enter the amount you want to spend on electricity')
+                        ),
+                        Div(
+                            Label('Initial payment already made (optional):', For='initial-amount-input'),
+                            Input(
+                                type='number', 
+                                id='initial-amount-input',
+                                name='initial_amount', 
+                                placeholder='0.00', 
+                                min='0', 
+                                step='0.01',
+                                **live_field('input changed delay:300ms', '#amount-input, this, input[name="tariff_type"]:checked'),
+                                style='max-width: 300px;'
+                            ),
+                            Small('Enter any amount already paid at the beginning of the month')
+                        ),
+                        # Both fields go in one request, so it has the same query whichever changed
+                        **live_form('/calculate-units-live', '#units-result', 'input changed delay:300ms', 'input[name="tariff_type"]:checked')
+                    ),
+                    
+                    Hr(),
+                    
+                    Section(
+                        H2('Calculate Cost from Units'),
+                        Form(
+                            Div(
+                                Label('Enter units (kWh):', For='units-input'),
+                                Input(
+                                    type='number', 
+                                    id='units-input',
+                                    name='units', 
+                                    placeholder='0.00', 
+                                    min='0', 
+                                    step='0.01',
+                                    **live_request('/calculate-cost-live', '#cost-result'),
+                                    hx_trigger='input changed delay:300ms',
+                                    hx_include='this, input[name="tariff_type"]:checked',  # Updated
+                                    style='max-width: 300px;'
+                                ),
+                                Small('Enter the number of kilowatt-hours (kWh) consumed')
+                            )
+                        )
+                    ),
+                    cls='input-section'
+                ),
+                
+                Div(
+                    Div(id='units-result', cls='result-container'),
+                    Div(id='cost-result', cls='result-container'),
+                    cls='results-section'
+                ),
+                cls='calculator-container'
+            ),
+            cls='main-container'
+        ),
+        **({'hx_ext': 'ws', 'ws_connect': '/live'} if LIVE_WEBSOCKET else {})
+    )
+
+async def index(request: Request):
+    return cached_page(request, index_page)
+
+def cost_result(units_val: float, tariff_type: str, lvl: int | None = None, **attrs):
+    """Result summary and breakdown for a cost-from-units calculation, serialized at lvl when known"""
+    with stage('calc'):
+        result, breakdown = calculateAmountFromUnits(units_val, tariff_type)
+    note_calculation(tariff_type, 'cost')
+    tariff_desc = get_schedule(tariff_type).description
+    
+    with stage('render'):
+        return Div(
+            Div(
+                H3("Cost Calculation Result"),
+                P(f"{units_val} kWh = {result} RWF", cls='highlight'),
+                Small(f"Using {tariff_desc}", style='color: var(--muted-color);'),
+                cls='result-summary'
+            ),
+            breakdown_table(breakdown, None if lvl is None else lvl + 2),
+            **attrs
+        )
+
+def units_result(amount_val: float, initial_val: float, tariff_type: str, lvl: int | None = None, **attrs):
+    """Result summary and breakdown for a units-from-amount calculation, serialized at lvl when known"""
+    with stage('calc'):
+        result, breakdown = calculateUnitsFromAmount(amount_val, initial_val, tariff_type)
+    note_calculation(tariff_type, 'units')
+    tariff_desc = get_schedule(tariff_type).description
+    
+    # Create result text based on what was entered
+    if initial_val > 0 and amount_val > 0:
+        result_text = f"{result} kWh (Total: {breakdown.total} RWF = {initial_val} + {amount_val})"
+        title = "Units Calculation Result"
+    elif initial_val > 0 and amount_val == 0:
+        result_text = f"{result} kWh from initial payment of {initial_val} RWF"
+        title = "Units from Initial Payment"
+    else:
+        result_text = f"{result} kWh = {amount_val} RWF"
+        title = "Units Calculation Result"
+    
+    with stage('render'):
+        return Div(
+            Div(
+                H3(title),
+                P(result_text, cls='highlight'),
+                Small(f"Using {tariff_desc}", style='color: var(--muted-color);'),
+                cls='result-summary'
+            ),
+            breakdown_table(breakdown, None if lvl is None else lvl + 2),
+            **attrs
+        )
+
+# Query fields of each live route in the order the page sends them: HTMX puts the triggering
+# element's values first, then the hx-include matches in document order
+COST_FIELDS = ('units', 'tariff_type')
+UNITS_FIELDS = ('amount', 'initial_amount', 'tariff_type')
+TARIFF_FIELDS = ('tariff_type', 'amount', 'initial_amount', 'units')
+
+class NormalizedQuery:
+    """Route inputs parsed once: numbers as floats (None when empty or invalid), tariff_type as its key"""
+    __slots__ = ('numbers', 'invalid', 'tariff_type', 'canonical_url')
+
+    def __init__(self, numbers: dict, invalid: set, tariff_type: str, canonical_url: str | None):
+        self.numbers = numbers
+        self.invalid = invalid
+        self.tariff_type = tariff_type
+        self.canonical_url = canonical_url
+
+    def given(self, name: str) -> bool:
+        """True when the field was sent with a non-blank value"""
+        return name in self.invalid or self.numbers.get(name) is not None
+
+    def number(self, name: str, default=None) -> float | None:
+        """The field's value, default when it was left empty; ValueError when it is not a number"""
+        if name in self.invalid:
+            raise ValueError(f"Invalid number for {name}")
+        value = self.numbers.get(name)
+        return default if value is None else value
+
+    def redirect(self) -> Response:
+        """Permanent, cacheable redirect to the canonical URL"""
+        return RedirectResponse(self.canonical_url, status_code=308, headers={'Cache-Control': FRAGMENT_CACHE_CONTROL})
+
+def canonical_number(text: str) -> tuple[float, str]:
+    """Parse a number and give its canonical spelling: '1000', '01000', '1e3' and '1000.0' are all '1000'"""
+    value = float(text)
+    if value.is_integer() and abs(value) < 1e16:
+        return value, str(int(value))
+    return value, repr(value)
+
+def normalize_params(path: str, items, fields: tuple) -> NormalizedQuery:
+    """Parse (name, value) pairs; canonical_url is path with them in canonical form, if they were not
+
+    The canonical form has every one of fields, in that order, which is the order the page sends
+    them in. Numbers are trimmed and respelled, a missing number is empty, the tariff id becomes
+    tariff_key() ('new' when missing), parameters the route does not use are dropped and repeated
+    ones keep their last value. Invalid numbers are left as sent.
+    """
+    items = list(items)
+    sent = dict(items)
+    numbers, invalid, canonical = {}, set(), {}
+    tariff_type = 'new'
+    for name in fields:
+        raw = sent.get(name)
+        if name == 'tariff_type':
+            text = tariff_type = 'new' if raw is None else tariff_key(raw)
+        else:
+            text, value = (raw or '').strip(), None
+            if text:
+                try:
+                    value, text = canonical_number(text)
+                except ValueError:
+                    text = raw
+                    invalid.add(name)
+            numbers[name] = value
+        canonical[name] = text
+    
+    canonical_url = None if items == list(canonical.items()) else f'{path}?{urlencode(canonical)}'
+    return NormalizedQuery(numbers, invalid, tariff_type, canonical_url)
+
+def normalize_query(request: Request, fields: tuple) -> NormalizedQuery:
+    """Parse a calculation route's query string"""
+    return normalize_params(request.url.path, request.query_params.multi_items(), fields)
+
+def live_cost(query: NormalizedQuery, fragment):
+    """The cost result for a parsed query; fragment(key, render) serves the calculated ones"""
+    if not query.given('units'):
+        return Div()
+    
+    try:
+        units_val = query.number('units')
+        
+        if units_val == 0:
+            return Div()
+        
+        return fragment(
+            ('/calculate-cost-live', query.tariff_type, units_val),
+            lambda lvl: cost_result(units_val, query.tariff_type, lvl)
+        )
+    except (ValueError, TypeError) as e:
+        note_invalid_input()
+        return Div(P(f"Invalid input: Please enter a valid number", cls='error'))
+
+def live_units(query: NormalizedQuery, fragment):
+    """The units result for a parsed query; fragment(key, render) serves the calculated ones"""
+    # Show calculation even if only initial_amount is provided
+    if not query.given('amount') and not query.given('initial_amount'):
+        return Div()
+    
+    try:
+        amount_val = query.number('amount', 0)
+        initial_val = query.number('initial_amount', 0)
+        
+        # Show result if either amount or initial amount has a value
+        if amount_val == 0 and initial_val == 0:
+            return Div()
+        
+        return fragment(
+            ('/calculate-units-live', query.tariff_type, amount_val, initial_val),
+            lambda lvl: units_result(amount_val, initial_val, query.tariff_type, lvl)
+        )
+    except (ValueError, TypeError) as e:
+        note_invalid_input()
+        return Div(P(f"Invalid input: Please enter valid numbers", cls='error'))
+
+async def calculate_cost_live(request: Request):
+    with stage('parse'):
+        query = normalize_query(request, COST_FIELDS)
+    if query.canonical_url:
+        return query.redirect()
+    return live_cost(query, functools.partial(cached_fragment, request))
+
+async def calculate_units_live(request: Request):
+    with stage('parse'):
+        query = normalize_query(request, UNITS_FIELDS)
+    if query.canonical_url:
+        return query.redirect()
+    return live_units(query, functools.partial(cached_fragment, request))
+
+async def update_tariff(request: Request):
+    """Handle tariff type changes and recalculate results"""
+    with stage('parse'):
+        query = normalize_query(request, TARIFF_FIELDS)
+    if query.canonical_url:
+        return query.redirect()
+    tariff_type = query.tariff_type
+    
+    def render(lvl=None):
+        results = []
+        result_lvl = None if lvl is None else lvl + 2
+        
+        # Recalculate units result if amount inputs have values
+        if query.given('amount') or query.given('initial_amount'):
+            try:
+                amount_val = query.number('amount', 0)
+                initial_val = query.number('initial_amount', 0)
+                
+                if amount_val > 0 or initial_val > 0:
+                    results.append(units_result(amount_val, initial_val, tariff_type, result_lvl, id='units-result'))
+            except (ValueError, TypeError):
+                note_invalid_input()
+                results.append(Div(P("Invalid amount input", cls='error'), id='units-result'))
+        else:
+            results.append(Div(id='units-result'))
+        
+        # Recalculate cost result if units input has value
+        if query.given('units'):
+            try:
+                units_val = query.number('units')
+                
+                if units_val > 0:
+                    results.append(cost_result(units_val, tariff_type, result_lvl, id='cost-result'))
+            except (ValueError, TypeError):
+                note_invalid_input()
+                results.append(Div(P("Invalid units input", cls='error'), id='cost-result'))
+        else:
+            results.append(Div(id='cost-result'))
+        
+        return Div(*results)
+    
+    if query.invalid:
+        return render()
+    key = ('/update-tariff', tariff_type, query.numbers.get('amount'), query.numbers.get('initial_amount'), query.numbers.get('units'))
+    return cached_fragment(request, key, render)
+
+# Default Pico CSS, as fast_app would add it; fasthtml.pico also imports IPython when installed
+PICO_HEADERS = (Link(rel="stylesheet", href="https://cdn.jsdelivr.net/npm/@anyblades/pico@latest/css/pico.min.css"),
+                Style(":root { --pico-font-size: 100%; }"))
+
+def calculator_app() -> FastHTML:
+    """The calculator page, its live fragment routes and static files as a FastHTML app"""
+    # Nothing uses sessions, so there is no session middleware: no cookie to verify per request
+    # and never a Set-Cookie on a cacheable response. fast_app cannot turn the middleware off, so
+    # the app is built the way it would build it. The signing key is unused; passing one keeps
+    # FastHTML from reading or writing .sesskey.
+    app = FastHTML(hdrs=PICO_HEADERS, sess_cls=None, secret_key=os.environ.get('SECRET_KEY') or secrets.token_hex(16))
+    app.static_route_exts(static_path='.')
+    
+    # The page and live routes are async handlers: their work is microseconds of CPU, so it runs
+    # inline on the event loop rather than queueing for a threadpool thread under load
+    app.route('/', methods='get')(index)
+    app.route('/calculate-cost-live', methods='get')(calculate_cost_live)
+    app.route('/calculate-units-live', methods='get')(calculate_units_live)
+    app.route('/update-tariff', methods='get')(update_tariff)
+    
+    # Ahead of FastHTML's catch-all static route, which would otherwise match /static paths first
+    app.routes.insert(0, Mount('/static', app=StaticFiles(directory=STATIC_DIR), name='static'))
+    app.routes.insert(0, Route(STYLESHEET_URL, stylesheet))
+    prerender_page(app, '/', index_page)
+    return app